@@ -0,0 +1,111 @@
+import argparse
+import json
+from sys import stdout
+
+try:
+    from time import perf_counter
+except ImportError:
+    from time import time as perf_counter
+
+from bitboard import BitboardSearch, GameLayout, TranspositionTable
+
+# Headless benchmark of alpha-beta on k-in-a-row boards.
+# Every game is played by alpha-beta against itself, with iterative deepening
+# for `seconds` a move, for `moves` moves or until it ends, and is summarized
+# by the depth reached and the moves tried per second.
+#
+#   python -m adversarial.bench --games 3x3x3,7x7x4,15x15x5 --seconds 1 --moves 10 --radius 1
+
+
+# (height, width, k) of a game written as HxWxK.
+def parse_game(game):
+    return tuple(int(side) for side in game.lower().split('x'))
+
+
+# Plays the game and returns a record of every move.
+def play(game, seconds, moves, radius=None, max_depth=None):
+    layout = GameLayout.for_game(game)
+    iterations = {'ab': 0}
+    search = BitboardSearch(iterations, 'ab', TranspositionTable(), radius)
+    own, other = 0, 0
+    records = []
+
+    for move in range(moves):
+        iterations['ab'] = 0
+        start_time = perf_counter()
+        square, score = search.iterative_deepening(layout, own, other, max_depth=max_depth, seconds=seconds)
+        elapsed = perf_counter() - start_time
+        records.append({
+            'move': move,
+            'square': square,
+            'score': score,
+            'depth': search.depth,
+            'iterations': iterations['ab'],
+            'seconds': elapsed,
+            'nodes_per_second': iterations['ab'] / elapsed if elapsed > 0 else 0.0
+        })
+
+        mine = own | (1 << (square - 1))
+        if layout.won_at(mine, square - 1) or mine | other == layout.full:
+            break
+        own, other = other, mine
+
+    return records
+
+
+def summarize(game, records):
+    return {
+        'game': 'x'.join(str(side) for side in game),
+        'moves': len(records),
+        'max_depth': max(record['depth'] for record in records),
+        'mean_depth': sum(record['depth'] for record in records) / float(len(records)),
+        'max_seconds': max(record['seconds'] for record in records),
+        'nodes_per_second': sum(record['iterations'] for record in records) /
+                            max(sum(record['seconds'] for record in records), 1e-9)
+    }
+
+
+# Plays every game and returns (raw records, summaries).
+def run(games, seconds=1.0, moves=10, radius=None, max_depth=None, output=stdout):
+    raw_records = []
+    summaries = []
+
+    for game in games:
+        records = play(game, seconds, moves, radius, max_depth)
+        summary = summarize(game, records)
+        for record in records:
+            record['game'] = summary['game']
+        raw_records.extend(records)
+        summaries.append(summary)
+        output.write('\n{game:>10} moves={moves} depth={mean_depth:.1f} (max {max_depth}) '
+                     'max={max_seconds:.3f}s nodes/s={nodes_per_second:.0f}\n'.format(**summary))
+        output.flush()
+
+    return raw_records, summaries
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Benchmark alpha-beta on k-in-a-row games.')
+    parser.add_argument('--games', default='3x3x3,7x7x4,15x15x5', help='comma separated HxWxK boards')
+    parser.add_argument('--seconds', type=float, default=1.0, help='search time of each move')
+    parser.add_argument('--moves', type=int, default=10, help='moves played in each game')
+    parser.add_argument('--radius', type=int, help='only search squares this near the squares played')
+    parser.add_argument('--max-depth', type=int)
+    parser.add_argument('--json', help='write raw records and summaries to this JSON file')
+    options = parser.parse_args(arguments)
+
+    raw_records, summaries = run(
+            [parse_game(game) for game in options.games.split(',')],
+            options.seconds,
+            options.moves,
+            options.radius,
+            options.max_depth
+    )
+
+    if options.json:
+        with open(options.json, 'w') as json_file:
+            json.dump({'records': raw_records, 'summaries': summaries}, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,462 @@
+import os
+import pickle
+import random
+
+try:
+    from time import perf_counter
+except ImportError:
+    from time import time as perf_counter
+
+# k-in-a-row boards as int bitmasks: square s, numbered 1 to height * width
+# row by row as in MinMaxClass, is bit s - 1. Tic-tac-toe is the 3x3 board
+# with k = 3.
+# Searches take a position as the (player to move, opponent) pair of masks
+# and are negamax: scores are from the point of view of the player to move,
+# 1 for a win, 0 for a tie and -1 for a loss. Positions evaluated at a search
+# horizon score strictly between -1 and 1.
+
+# Bound types of transposition table values.
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+# Masks of a height x width board won with k squares in a row, column or
+# diagonal, shared by every search on it.
+# lines are the masks of every k squares in a row, and lines_through[index]
+# the indexes in lines of those through a square.
+# permutations[t][index] is the bit an index goes to under the board's t-th
+# rotation or reflection, the identity first, and inverses[t] takes it back.
+# Symmetric positions have the same value, and the best squares of one are
+# the transformed best squares of the other.
+class GameLayout(object):
+    layouts = {}
+
+    def __init__(self, height, width, k):
+        self.height = height
+        self.width = width
+        self.k = k
+        self.squares = height * width
+        self.full = (1 << self.squares) - 1
+        self.center = width * (height // 2) + width // 2
+
+        last_row, last_col = height - 1, width - 1
+        transforms = [
+            lambda row, col: (row, col),
+            lambda row, col: (row, last_col - col),
+            lambda row, col: (last_row - row, col),
+            lambda row, col: (last_row - row, last_col - col)
+        ]
+        # Quarter turns and diagonal reflections only keep a square board.
+        if height == width:
+            transforms += [
+                lambda row, col: (col, last_row - row),
+                lambda row, col: (last_col - col, row),
+                lambda row, col: (col, row),
+                lambda row, col: (last_col - col, last_row - row)
+            ]
+        self.permutations = []
+        self.inverses = []
+        for transform in transforms:
+            permutation = [width * new_row + new_col for new_row, new_col in
+                           (transform(*divmod(index, width)) for index in range(self.squares))]
+            inverse = [0] * self.squares
+            for index, new_index in enumerate(permutation):
+                inverse[new_index] = index
+            self.permutations.append(permutation)
+            self.inverses.append(inverse)
+
+        # Each transform applied a byte of the mask at a time.
+        self.symmetry_tables = []
+        for permutation in self.permutations:
+            chunk_tables = []
+            for chunk in range(0, self.squares, 8):
+                table = [0] * 256
+                for byte in range(256):
+                    for bit in range(min(8, self.squares - chunk)):
+                        if byte >> bit & 1:
+                            table[byte] |= 1 << permutation[chunk + bit]
+                chunk_tables.append(table)
+            self.symmetry_tables.append(chunk_tables)
+
+        self.lines = []
+        self.lines_through = [[] for _ in range(self.squares)]
+        for row_step, col_step in [(0, 1), (1, 0), (1, 1), (1, -1)]:
+            for row in range(height):
+                for col in range(width):
+                    end_row, end_col = row + row_step * (k - 1), col + col_step * (k - 1)
+                    if not (0 <= end_row < height and 0 <= end_col < width):
+                        continue
+                    indexes = [width * (row + row_step * i) + col + col_step * i for i in range(k)]
+                    for index in indexes:
+                        self.lines_through[index].append(len(self.lines))
+                    self.lines.append(self.mask(index + 1 for index in indexes))
+        if not self.lines:
+            raise ValueError("{} in a row does not fit a {}x{} board".format(k, height, width))
+
+        # Evaluation weights of a line open to one player, by the player's
+        # squares on it.
+        self.weights = [0] + [4 ** count for count in range(1, k)]
+        self.neighbourhoods = {}
+
+    # game: game_width of a game_width x game_width board won with a full
+    # row, column or diagonal, or the (height, width, k) of a board.
+    @staticmethod
+    def for_game(game):
+        if not isinstance(game, tuple):
+            game = (game, game, game)
+        if game not in GameLayout.layouts:
+            GameLayout.layouts[game] = GameLayout(*game)
+        return GameLayout.layouts[game]
+
+    @staticmethod
+    def mask(squares):
+        mask = 0
+        for square in squares:
+            mask |= 1 << (square - 1)
+        return mask
+
+    # Bit indexes of the set bits of a mask.
+    @staticmethod
+    def indexes(mask):
+        indexes = []
+        while mask:
+            low = mask & -mask
+            indexes.append(low.bit_length() - 1)
+            mask ^= low
+        return indexes
+
+    # Bit indexes of the empty squares.
+    def free(self, own, other):
+        free = self.full & ~(own | other)
+        return [index for index in range(self.squares) if free >> index & 1]
+
+    # Mask of the squares at most radius rows and columns away from a square
+    # of the mask.
+    def near(self, mask, radius):
+        if radius not in self.neighbourhoods:
+            neighbourhoods = []
+            for index in range(self.squares):
+                row, col = divmod(index, self.width)
+                neighbourhoods.append(self.mask(
+                        self.width * near_row + near_col + 1
+                        for near_row in range(max(0, row - radius), min(self.height, row + radius + 1))
+                        for near_col in range(max(0, col - radius), min(self.width, col + radius + 1))))
+            self.neighbourhoods[radius] = neighbourhoods
+
+        neighbourhoods = self.neighbourhoods[radius]
+        near = 0
+        for index in self.indexes(mask):
+            near |= neighbourhoods[index]
+        return near
+
+    def transform(self, mask, symmetry):
+        transformed = 0
+        for table in self.symmetry_tables[symmetry]:
+            transformed |= table[mask & 255]
+            mask >>= 8
+        return transformed
+
+    # Smallest (own, other) pair among the position's transforms, the same for
+    # every symmetric position, and the index of the transform giving it.
+    def canonical(self, own, other):
+        canonical, canonical_symmetry = (own, other), 0
+        for symmetry in range(1, len(self.symmetry_tables)):
+            key = (self.transform(own, symmetry), self.transform(other, symmetry))
+            if key < canonical:
+                canonical, canonical_symmetry = key, symmetry
+        return canonical, canonical_symmetry
+
+    # Free bit indexes, one for each set of moves leading to symmetric positions.
+    def distinct_moves(self, own, other, free):
+        seen = set()
+        moves = []
+        for index in free:
+            key = self.canonical(other, own | (1 << index))[0]
+            if key not in seen:
+                seen.add(key)
+                moves.append(index)
+        return moves
+
+    # Threat count of the lines still open to one player only: each one is
+    # worth 4 times more for every square of the player on it, and those a
+    # square short of k are threats. The player to move wins with a threat of
+    # their own, and loses to opponent threats on two different squares, as
+    # only one can be blocked. Other positions score the weighted difference,
+    # scaled between -0.5 and 0.5 so that threats rank first.
+    # Lines without a square played are open to both players and worth
+    # nothing, so only those through the squares played are counted.
+    def evaluate(self, own, other):
+        line_indexes = set()
+        for index in self.indexes(own | other):
+            line_indexes.update(self.lines_through[index])
+
+        threat = self.k - 1
+        score = 0
+        threats = set()
+        for line_index in line_indexes:
+            line = self.lines[line_index]
+            if not line & other:
+                count = bin(line & own).count('1')
+                if count == threat:
+                    return 0.9
+                score += self.weights[count]
+            elif not line & own:
+                count = bin(line & other).count('1')
+                if count == threat:
+                    threats.add(line & ~other)
+                score -= self.weights[count]
+
+        if len(threats) > 1:
+            return -0.9
+        return 0.5 * score / (abs(score) + self.weights[threat] + 1)
+
+    def won(self, mask):
+        for line in self.lines:
+            if mask & line == line:
+                return True
+        return False
+
+    # Whether the mask has k in a row through the square at index, the only
+    # lines a move there can complete.
+    def won_at(self, mask, index):
+        lines = self.lines
+        for line_index in self.lines_through[index]:
+            if mask & lines[line_index] == lines[line_index]:
+                return True
+        return False
+
+    # 'X' or 'O' for a win, None for a tie and False while the game goes on,
+    # like MinMaxClass.calculate.
+    def winner(self, x_mask, o_mask):
+        x_won = self.won(x_mask)
+        o_won = self.won(o_mask)
+
+        if x_won:
+            if o_won:
+                raise ValueError("Illegal tile_board")
+            return 'X'
+        if o_won:
+            return 'O'
+        if x_mask | o_mask == self.full:
+            return None
+        return False
+
+
+# Values of searched positions, keyed by the canonical (player to move,
+# opponent) masks, each with its bound type, best square on the canonical
+# board and the depth searched: the plies left, at most the empty squares for
+# a search to the end of the game. It can be shared by every search of a
+# session, and saved to disk.
+class TranspositionTable(object):
+    # path: file the table is loaded from, when it exists, and saved to.
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        self.hits = 0
+        if path and os.path.exists(path):
+            with open(path, 'rb') as table_file:
+                self.entries = pickle.load(table_file)
+
+    # (value, bound, square, depth) of the position, or None.
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+        return entry
+
+    def put(self, key, value, bound, square, depth):
+        self.entries[key] = (value, bound, square, depth)
+
+    def save(self, path=None):
+        with open(path or self.path, 'wb') as table_file:
+            pickle.dump(self.entries, table_file, pickle.HIGHEST_PROTOCOL)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class BitboardSearch(object):
+    # iterations: dict of counters, such as MinMaxClass.iterations. Every move
+    # tried adds one to iterations[counter].
+    # table: TranspositionTable of the search, None for none.
+    # radius: only try squares at most radius rows and columns away from the
+    # squares played, the center on an empty board, to search big boards.
+    # None to try every square, as needed for exact values.
+    def __init__(self, iterations, counter, table=None, radius=None):
+        self.iterations = iterations
+        self.counter = counter
+        self.table = table
+        self.radius = radius
+        # Of the current iterative deepening search, see cutoff.
+        self.killers = {}
+        self.history = {}
+        self.deadline = None
+        # Plies of the deepest search of the last iterative deepening that
+        # finished.
+        self.depth = 0
+
+    # Returns (square, score) of the best move, the first winning one found.
+    # root: only search one of the moves leading to symmetric positions.
+    def minimax(self, layout, own, other, root=False):
+        key, symmetry = layout.canonical(own, other)
+        if self.table is not None:
+            entry = self.table.get(key)
+            # Only values searched to the end of the game.
+            if entry is not None and entry[1] == EXACT and entry[3] == len(layout.free(own, other)):
+                return layout.inverses[symmetry][entry[2]] + 1, entry[0]
+
+        max_square, max_score = self.minimax_moves(layout, own, other, root)
+        if self.table is not None:
+            self.table.put(key, max_score, EXACT, layout.permutations[symmetry][max_square - 1],
+                           len(layout.free(own, other)))
+        return max_square, max_score
+
+    def minimax_moves(self, layout, own, other, root):
+        free = self.candidates(layout, own, other, layout.free(own, other))
+        random.shuffle(free)
+        if root:
+            free = layout.distinct_moves(own, other, free)
+
+        max_square, max_score = None, -2
+        for index in free:
+            self.iterations[self.counter] += 1
+
+            mine = own | (1 << index)
+            if layout.won_at(mine, index):
+                return index + 1, 1
+            if mine | other == layout.full:
+                score = 0
+            else:
+                score = -self.minimax(layout, other, mine)[1]
+
+            if score > max_score:
+                max_square, max_score = index + 1, score
+        return max_square, max_score
+
+    # Iterative deepening alpha-beta: searches 1, 2, ... plies deep, until
+    # max_depth plies, the end of the game, or seconds run out, and returns
+    # the (square, score) of the deepest search that finished.
+    # Each search tries the best squares of the one before first, through the
+    # table, so the principal variation is searched first.
+    def iterative_deepening(self, layout, own, other, alpha=-1, beta=1, max_depth=None, seconds=None):
+        if self.table is None:
+            self.table = TranspositionTable()
+        self.killers = {}
+        self.history = {}
+        self.deadline = None
+        self.depth = 0
+
+        free_count = len(layout.free(own, other))
+        max_depth = min(max_depth or free_count, free_count)
+        result = None
+        for depth in range(1, max_depth + 1):
+            # The first search always finishes, so that there is a move to play.
+            if seconds is not None and depth == 2:
+                self.deadline = perf_counter() + seconds
+            try:
+                result = self.alpha_beta(layout, own, other, alpha, beta, root=True, depth=depth)
+            except SearchTimeout:
+                break
+            self.depth = depth
+            # Decided before the horizon, deeper searches cannot change it.
+            if abs(result[1]) == 1:
+                break
+
+        self.deadline = None
+        return result
+
+    # Returns (square, score) of the best move. A score at or below alpha is
+    # only an upper bound, and one at or above beta only a lower bound.
+    # Squares are tried in order: the table's best square, the killer squares
+    # of the ply, then by history.
+    # root: only search one of the moves leading to symmetric positions.
+    # depth: plies to search before evaluating the position, None for the
+    # whole game.
+    # ply: plies from the root.
+    def alpha_beta(self, layout, own, other, alpha, beta, root=False, depth=None, ply=0):
+        # Scores go from -1 to 1. A wider window would search on past a win,
+        # and store the bounds found there as values.
+        alpha, beta = max(alpha, -1), min(beta, 1)
+        free = layout.free(own, other)
+        if depth is None or depth > len(free):
+            depth = len(free)
+        if depth == 0:
+            return None, layout.evaluate(own, other)
+
+        key, symmetry = layout.canonical(own, other)
+        table_index = None
+        if self.table is not None:
+            entry = self.table.get(key)
+            if entry is not None:
+                value, bound, table_index, entry_depth = entry
+                table_index = layout.inverses[symmetry][table_index]
+                if entry_depth >= depth and (bound == EXACT or (bound == LOWER and value >= beta) or
+                                             (bound == UPPER and value <= alpha)):
+                    return table_index + 1, value
+
+        free = self.ordered(self.candidates(layout, own, other, free), table_index, ply)
+        if root:
+            free = layout.distinct_moves(own, other, free)
+
+        original_alpha = alpha
+        max_square, max_score = None, -2
+        for index in free:
+            self.iterations[self.counter] += 1
+            if self.deadline is not None and self.iterations[self.counter] % 256 == 0 and perf_counter() > self.deadline:
+                raise SearchTimeout()
+
+            mine = own | (1 << index)
+            if layout.won_at(mine, index):
+                max_square, max_score = index + 1, 1
+                break
+            if mine | other == layout.full:
+                score = 0
+            else:
+                score = -self.alpha_beta(layout, other, mine, -beta, -alpha, depth=depth - 1, ply=ply + 1)[1]
+
+            if score > max_score:
+                max_square, max_score = index + 1, score
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                self.cutoff(index, depth, ply)
+                break
+
+        if self.table is not None:
+            # A win is the best score there is, so it is always exact.
+            if original_alpha < max_score < beta or max_score == 1:
+                bound = EXACT
+            elif max_score <= original_alpha:
+                bound = UPPER
+            else:
+                bound = LOWER
+            self.table.put(key, max_score, bound, layout.permutations[symmetry][max_square - 1], depth)
+        return max_square, max_score
+
+    # The free bit indexes to try, see radius.
+    def candidates(self, layout, own, other, free):
+        if self.radius is None:
+            return free
+        if not own | other:
+            return [layout.center]
+        near = layout.near(own | other, self.radius)
+        return [index for index in free if near >> index & 1]
+
+    def ordered(self, free, table_index, ply):
+        history = self.history
+        first = [table_index] + self.killers.get(ply, [])
+        first = [index for position, index in enumerate(first) if index in free and index not in first[:position]]
+        rest = sorted((index for index in free if index not in first), key=lambda index: -history.get(index, 0))
+        return first + rest
+
+    # Remembers a square that cut the search off, as a killer of its ply and
+    # in the history, by the depth of the subtree it saved.
+    def cutoff(self, index, depth, ply):
+        killers = self.killers.setdefault(ply, [])
+        if index not in killers:
+            killers.insert(0, index)
+            del killers[2:]
+        self.history[index] = self.history.get(index, 0) + depth * depth
+
+
+class SearchTimeout(Exception):
+    pass
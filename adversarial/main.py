@@ -1,15 +1,33 @@
+import os
 import random
 import matplotlib.pyplot as plt
 import numpy as np
 
+from bitboard import BitboardSearch, GameLayout, TranspositionTable
+
 
 class MinMaxClass:
-    def __init__(self, players=list()):
+    # tables: TranspositionTable of each player, by counter ('mm' and 'ab'),
+    # kept by every game played with it. New ones by default. The players
+    # never share one, so that each one's iterations are its own.
+    # max_depth, seconds: plies and time the alpha-beta player searches each
+    # move for, deepening one ply at a time. None to search to the end.
+    # radius: only search squares near the squares played, see BitboardSearch.
+    def __init__(self, players=list(), tables=None, max_depth=None, seconds=None, radius=None):
+        self.max_depth = max_depth
+        self.seconds = seconds
         self.iterations = {
             'mm': 0,
             'ab': 0
         }
+        self.tables = tables if tables is not None else player_tables()
+        self.searches = {
+            'mm': BitboardSearch(self.iterations, 'mm', self.tables['mm'], radius),
+            'ab': BitboardSearch(self.iterations, 'ab', self.tables['ab'], radius)
+        }
 
+    # game_width: width of a square board won with a full row, column or
+    # diagonal, or the (height, width, k) of a board won with k in a row.
     def Tic_Tac_Toe(self, X, O, game_width=3):
         tile_board = (set(), set(), game_width)
 
@@ -37,45 +55,38 @@ class MinMaxClass:
             raise ValueError("The game didn't end")
         return winner, self.iterations['mm'], self.iterations['ab']
 
+    # 'X' or 'O' for a win, None for a tie and False while the game goes on.
     def calculate(self, tile_board):
         x_squares, o_squares, game_width = tile_board
-        rrrs = [{game_width * rrr + col + 1 for col in range(game_width)} for rrr in range(game_width)]
-        cols = [{game_width * rrr + col + 1 for rrr in range(game_width)} for col in range(game_width)]
-        diagonals = [{game_width * i + i + 1 for i in range(game_width)},
-                     {game_width * i + game_width - i for i in range(game_width)}]
-
-        lines = rrrs + cols + diagonals
-
-        x_won = any(line.issubset(x_squares) for line in lines)
-        o_won = any(line.issubset(o_squares) for line in lines)
+        layout = GameLayout.for_game(game_width)
+        return layout.winner(layout.mask(x_squares), layout.mask(o_squares))
 
-        if x_won:
-            if o_won:
-                raise ValueError("Illegal tile_board")
-            return 'X'
-        if o_won:
-            return 'O'
-        if x_squares | o_squares == set(range(1, game_width ** 2 + 1)):
-            # Nobody won, but the tile_board is full
-            return None  # Tie
-
-        return False
+    # The tile_board as bitmasks: (layout, player's squares, opponent's squares).
+    def bitboards(self, tile_board, player):
+        x_squares, o_squares, game_width = tile_board
+        layout = GameLayout.for_game(game_width)
+        x_mask, o_mask = layout.mask(x_squares), layout.mask(o_squares)
+        if player == 'X':
+            return layout, x_mask, o_mask
+        return layout, o_mask, x_mask
 
     def print_board(self, tile_board):
         return_str = ''
         x_squares, o_squares, game_width = tile_board
-        for rrr in range(game_width):
-            for col in range(game_width):
-                square = game_width * rrr + col + 1
+        layout = GameLayout.for_game(game_width)
+        for rrr in range(layout.height):
+            for col in range(layout.width):
+                square = layout.width * rrr + col + 1
                 return_str += 'X' if square in x_squares else 'O' if square in \
                                                                      o_squares else ' '
-                if col != game_width - 1: return_str += ' | '
-            if rrr != game_width - 1: return_str += '\n' + '--+-' * (game_width - 1) + '-\n'
+                if col != layout.width - 1: return_str += ' | '
+            if rrr != layout.height - 1: return_str += '\n' + '--+-' * (layout.width - 1) + '-\n'
         return return_str
 
     def human_player(self, tile_board, player):
 
         x_squares, o_squares, game_width = tile_board
+        squares = GameLayout.for_game(game_width).squares
         print("")
         print("")
         print self.print_board(tile_board)
@@ -84,17 +95,18 @@ class MinMaxClass:
             try:
                 square = int(
                         raw_input('Where do you want to add ' + player + '? '))
-                assert 0 < square <= game_width ** 2 and \
+                assert 0 < square <= squares and \
                        square not in x_squares | o_squares
                 return square  # this will happen if there were no exceptions
             except:
-                print ('You should write an integer between 1 and ' + str(game_width ** 2) +
+                print ('You should write an integer between 1 and ' + str(squares) +
                        ', that represents a blank square.')
 
     def random_player(self, tile_board, player):
         x_squares, o_squares, game_width = tile_board
+        squares = GameLayout.for_game(game_width).squares
 
-        available_squares = list(set(range(1, game_width ** 2 + 1)) - (x_squares | o_squares))
+        available_squares = list(set(range(1, squares + 1)) - (x_squares | o_squares))
         random.shuffle(available_squares)
 
         return random.choice(available_squares)
@@ -105,89 +117,57 @@ class MinMaxClass:
         return self.minimax_best_square(tile_board, player)[0]
 
     def minimax_score_tile_board(self, tile_board, player):
-        if self.calculate(tile_board) == player:
+        winner = self.calculate(tile_board)
+        if winner == player:
             return 1
-        if self.calculate(tile_board) is 'Tie':
+        if winner is None:
             return 0
-        if self.calculate(tile_board) is not False:
+        if winner is not False:
             return -1
         return self.minimax_best_square(tile_board, player)[1]
 
+    # Searched on bitboards, see bitboard.py.
     def minimax_best_square(self, tile_board, player):
-        x_squares, o_squares, game_width = tile_board
-        max_score = -2
-
-        opponent = list({'X', 'O'} - set([player]))[0]
-        available_squares = list(set(range(1, game_width ** 2 + 1)) - (x_squares | o_squares))
-        random.shuffle(available_squares)
-
-        for square in available_squares:
-            if len(available_squares) == 9:
-                return square, 5
-            self.iterations['mm'] += 1
-
-            # Iterate over the blank squares, to get the best square to play
-            new_tile_board = (x_squares | set([square] if player == 'X' else []),) + \
-                             (o_squares | set([square] if player == 'O' else []), game_width)
-            score = -self.minimax_score_tile_board(new_tile_board, opponent)
-
-            if score == 1:
-                return square, 1
-
-            if score > max_score:
-                max_score, max_square = score, square
-        return max_square, max_score
+        layout, own, other = self.bitboards(tile_board, player)
+        return self.searches['mm'].minimax(layout, own, other, root=True)
 
     def alpha_beta_player(self, tile_board, player, alpha=-2, beta=2):
         print("Total Iterations of minimax : " + str(self.iterations['ab']) + " - " + player)
         return self.alpha_beta_best_square(tile_board, player, alpha, beta)[0]
 
     def alpha_beta_score_tile_board(self, tile_board, player, alpha, beta):
-
-        if self.calculate(tile_board) == player:
+        winner = self.calculate(tile_board)
+        if winner == player:
             return 1
-        if self.calculate(tile_board) is None:
+        if winner is None:
             return 0
-        if self.calculate(tile_board) is not False:
+        if winner is not False:
             return -1
         return self.alpha_beta_best_square(tile_board, player, alpha, beta)[1]
 
     def alpha_beta_best_square(self, tile_board, player, alpha, beta):
         """Choose a square where it's worthwhile to play in the given tile_board and
         turn, and return a tuple of the square's number and it's score according
-        to the minimax algorithm."""
-        x_squares, o_squares, game_width = tile_board
-
-        opponent = list({'X', 'O'} - set([player]))[0]
-        available_squares = list(set(range(1, game_width ** 2 + 1)) - (x_squares | o_squares))
-        random.shuffle(available_squares)
-
-        for square in available_squares:
-            self.iterations['ab'] += 1
-
-            # Iterate over the blank squares, to get the best square to play
-            new_tile_board = (x_squares | set([square] if player == 'X' else []),) + \
-                             (o_squares | set([square] if player == 'O' else []), game_width)
-            score = -self.alpha_beta_score_tile_board(new_tile_board, opponent, alpha, beta)
-
-            if player == 'O':
-                if score > alpha:
-                    alpha = score
-                if alpha >= beta:
-                    return square, beta
-            else:
-                if score < beta:
-                    beta = score
-                if beta <= alpha:
-                    return square, alpha
-
-        if player == 'O':
-            return square, alpha
-        else:
-            return square, beta
-
-
-def mm_vs_ab():
+        to the minimax algorithm, searched on bitboards with alpha-beta pruning
+        and iterative deepening, within max_depth plies and seconds."""
+        layout, own, other = self.bitboards(tile_board, player)
+        return self.searches['ab'].iterative_deepening(layout, own, other, alpha, beta, self.max_depth, self.seconds)
+
+
+# A TranspositionTable for each player of MinMaxClass.
+# directory: where the tables are loaded from, when they exist, and saved
+# to. None to keep them in memory only.
+def player_tables(directory=None):
+    tables = {}
+    for counter in ('mm', 'ab'):
+        path = os.path.join(directory, 'transpositions_{}.pickle'.format(counter)) if directory else None
+        tables[counter] = TranspositionTable(path)
+    return tables
+
+
+# tables: the players' tables, kept across the games, new ones by default.
+def mm_vs_ab(tables=None):
+    tables = tables if tables is not None else player_tables()
     calculate = {
         'mm_iters': [],
         'ab_iters': [],
@@ -197,7 +177,7 @@ def mm_vs_ab():
     }
 
     for i in range(100):
-        solver = MinMaxClass(['mm', 'ab'])
+        solver = MinMaxClass(['mm', 'ab'], tables)
         minmax_against_alphabeta = solver.display_tic_tac_toe(X=solver.minimax_player, O=solver.alpha_beta_player,
                                                               game_width=3)
         if minmax_against_alphabeta[0] == 'X':
@@ -211,7 +191,8 @@ def mm_vs_ab():
     return calculate
 
 
-def ab_vs_mm():
+def ab_vs_mm(tables=None):
+    tables = tables if tables is not None else player_tables()
     calculate = {
         'mm_iters': [],
         'ab_iters': [],
@@ -221,7 +202,7 @@ def ab_vs_mm():
     }
 
     for i in range(100):
-        solver = MinMaxClass(['mm', 'ab'])
+        solver = MinMaxClass(['mm', 'ab'], tables)
         minmax_against_alphabeta = solver.display_tic_tac_toe(X=solver.alpha_beta_player, O=solver.minimax_player,
                                                               game_width=3)
         if minmax_against_alphabeta[0] == 'O':
@@ -291,13 +272,24 @@ def plot_lines(calculate, limit, title):
 if __name__ == "__main__":
     solver = MinMaxClass(['mm', 'ab'])
     # solver.display_tic_tac_toe(X=solver.human_player, O=solver.alpha_beta_player, game_width=3)
+    # Gomoku, searching 2 seconds a move around the squares played:
+    # solver = MinMaxClass(['mm', 'ab'], seconds=2, radius=1)
+    # solver.display_tic_tac_toe(X=solver.human_player, O=solver.alpha_beta_player, game_width=(15, 15, 5))
     # calculate = solver.display_tic_tac_toe(X=solver.minimax_player, O=solver.alpha_beta_player, game_width=3)
-    calculate = mm_vs_ab()
+    # A directory to keep the players' tables in, such as this module's,
+    # so that later runs start from them. Off by default: the iterations
+    # plotted are then only those of the first run.
+    table_directory = None
+    tables = player_tables(table_directory)
+    calculate = mm_vs_ab(tables)
     plot_wins(calculate, 'Tic Tac Toe - MinMax vs AlphaBeta')
-    plot_lines(calculate, 1800, 'Tic Tac Toe - AlphaBeta vs MinMax - Execution iterations')
+    plot_lines(calculate, 2000, 'Tic Tac Toe - AlphaBeta vs MinMax - Execution iterations')
 
-    calculate = ab_vs_mm()
+    calculate = ab_vs_mm(tables)
+    if table_directory:
+        for table in tables.values():
+            table.save()
     plot_wins(calculate, 'Tic Tac Toe - AlphaBeta vs MinMax')
-    plot_lines(calculate, 1800, 'Tic Tac Toe - AlphaBeta vs MinMax - Execution iterations')
+    plot_lines(calculate, 2000, 'Tic Tac Toe - AlphaBeta vs MinMax - Execution iterations')
 
     # raw_input()
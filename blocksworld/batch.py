@@ -0,0 +1,102 @@
+from collections import namedtuple
+
+import numpy as np
+
+from puzzle import BlocksworldPuzzle, DIRECTIONS
+
+# Successor generation for a whole frontier layer at once.
+# A layer is an (n, 2) uint64 array holding, for each state, its packed board
+# and its agent's cell index, as in BlocksworldPuzzle.state and agent_index.
+# Only boards that pack into 64 bits can be expanded this way.
+
+# children: (m, 2) layer of every child.
+# keys: (m,) packed boards of the children, same as their puzzle_hash().
+# deltas: (m,) change of the Manhattan distance from parent to child.
+# parents: (m,) row of each child's parent in the expanded layer.
+# moves: (m,) move code of each child, an index into puzzle.DIRECTIONS.
+Expansion = namedtuple('Expansion', ['children', 'keys', 'deltas', 'parents', 'moves'])
+
+tables = {}
+
+
+def fits(layout):
+    return layout.cells * layout.bits <= 64
+
+
+def layer_from_states(puzzle_states):
+    return np.array([[puzzle_state.state, puzzle_state.agent_index] for puzzle_state in puzzle_states],
+                    dtype=np.uint64).reshape(-1, 2)
+
+
+# Layer of packed boards, finding each agent's cell from its board.
+def layer_from_boards(layout, boards):
+    shifts = np.arange(layout.cells, dtype=np.uint64) * np.uint64(layout.bits)
+    cells = (np.asarray(boards, dtype=np.uint64)[:, None] >> shifts) & np.uint64(layout.mask)
+
+    layer = np.empty((len(cells), 2), dtype=np.uint64)
+    layer[:, 0] = boards
+    layer[:, 1] = np.argmax(cells == BlocksworldPuzzle.agent, axis=1)
+    return layer
+
+
+# Per layout tables: the neighbor cell the agent reaches with each move code,
+# or -1, from the layout's move table, the move codes, and the goal distances
+# of every block from every cell, 0 for the agent and the filler blocks.
+def layout_tables(layout):
+    if layout not in tables:
+        if not fits(layout):
+            raise ValueError("A {}x{} board does not pack into 64 bits".format(layout.height, layout.width))
+
+        neighbors = np.full((layout.cells, len(DIRECTIONS)), -1, dtype=np.intp)
+        for index, cell_moves in enumerate(layout.moves):
+            for target, move in cell_moves:
+                neighbors[index][move] = target
+
+        move_codes = np.arange(len(DIRECTIONS), dtype=np.uint8)
+
+        goal_distances = np.zeros((layout.mask + 1, layout.cells), dtype=np.int64)
+        for block in layout.lettered_blocks:
+            goal_distances[block] = layout.goal_distances[block]
+
+        tables[layout] = neighbors, move_codes, goal_distances
+    return tables[layout]
+
+
+# Smallest board among each board and its transforms under the goal's
+# symmetries, as in BoardLayout.canonical.
+def canonical_boards(layout, boards):
+    if not layout.symmetries:
+        return boards
+
+    shifts = np.arange(layout.cells, dtype=np.uint64) * np.uint64(layout.bits)
+    cells = (np.asarray(boards, dtype=np.uint64)[:, None] >> shifts) & np.uint64(layout.mask)
+    canonical = np.asarray(boards, dtype=np.uint64)
+    for permutation in layout.symmetries:
+        transformed = np.bitwise_or.reduce(cells << shifts[list(permutation)], axis=1)
+        canonical = np.minimum(canonical, transformed)
+    return canonical
+
+
+# All the children of a layer, made with array operations only.
+def expand_layer(layout, layer):
+    neighbors, move_codes, goal_distances = layout_tables(layout)
+    bits = np.uint64(layout.bits)
+    mask = np.uint64(layout.mask)
+
+    targets = neighbors[layer[:, 1].astype(np.intp)]
+    parents, steps = np.nonzero(targets >= 0)
+    target = targets[parents, steps].astype(np.uint64)
+    agent = layer[parents, 1]
+    board = layer[parents, 0]
+
+    # The agent cell holds 0, so swapping it with the target block is two XORs.
+    block = (board >> (target * bits)) & mask
+    keys = board ^ (block << (agent * bits)) ^ (block << (target * bits))
+
+    block = block.astype(np.intp)
+    deltas = goal_distances[block, agent.astype(np.intp)] - goal_distances[block, target.astype(np.intp)]
+
+    children = np.empty((len(keys), 2), dtype=np.uint64)
+    children[:, 0] = keys
+    children[:, 1] = target
+    return Expansion(children, keys, deltas, parents, move_codes[steps])
@@ -0,0 +1,148 @@
+import argparse
+import csv
+import json
+import math
+from sys import stdout
+
+from config import setup
+from solver import SearchResult, Solver
+
+# Headless benchmark of search methods over a set of instances.
+# Every (method, instance) pair runs `warmups` untimed times, then `repeats`
+# timed times, and is summarized by the median and 95th percentile of its
+# wall time and nodes per second.
+#
+#   python -m blocksworld.bench --methods a_star,ida_star --size 4x5 --instances 5 --depth 40
+#
+# Raw results and summaries can be written to JSON and CSV files, so that
+# runs can be compared across commits.
+
+SUMMARY_FIELDS = [
+    'method', 'instance', 'runs', 'successful', 'moves_count', 'total_iters',
+    'median_seconds', 'p95_seconds', 'median_nodes_per_second', 'p95_nodes_per_second', 'max_peak_memory',
+    'peak_memory_source'
+]
+
+
+# Nearest-rank percentile of a list of numbers.
+def percentile(values, fraction):
+    values = sorted(values)
+    rank = max(0, int(math.ceil(fraction * len(values))) - 1)
+    return values[rank]
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+# (name, start, goal) instances: the default puzzle, or seeded generated ones.
+def build_instances(size=None, letters=3, depth=20, count=1, seed=0):
+    if size is None:
+        return [('default', setup.generate_puzzle(), setup.goal_state())]
+
+    height, width = [int(side) for side in size.lower().split('x')]
+    instances = []
+    for index in range(count):
+        start, goal = setup.generate_instance(height, width, letters, depth, seed + index)
+        instances.append(('{}x{}-l{}-d{}-s{}'.format(height, width, letters, depth, seed + index), start, goal))
+    return instances
+
+
+def summarize(method, instance, results):
+    seconds = [result.seconds for result in results]
+    nodes_per_second = [result.nodes_per_second for result in results]
+    peak_memories = [result.peak_memory for result in results if result.peak_memory is not None]
+
+    return {
+        'method': method,
+        'instance': instance,
+        'runs': len(results),
+        'successful': all(result.is_successful for result in results),
+        'moves_count': results[-1].moves_count,
+        'total_iters': results[-1].total_iters,
+        'median_seconds': median(seconds),
+        'p95_seconds': percentile(seconds, 0.95),
+        'median_nodes_per_second': median(nodes_per_second),
+        'p95_nodes_per_second': percentile(nodes_per_second, 0.95),
+        'max_peak_memory': max(peak_memories) if peak_memories else None,
+        'peak_memory_source': results[-1].peak_memory_source
+    }
+
+
+# Runs the method x instance matrix and returns (raw results, summaries).
+def run(methods, instances, heuristic='manhattan', warmups=1, repeats=5, trace_memory=False, output=stdout):
+    solver = Solver(trace_memory=trace_memory)
+    raw_results = []
+    summaries = []
+
+    for name, start, goal in instances:
+        for method in methods:
+            for _ in range(warmups):
+                solver.search(method, heuristic, start, goal)
+
+            results = [solver.search(method, heuristic, start, goal) for _ in range(repeats)]
+            for repeat, result in enumerate(results):
+                raw_result = result.to_dict()
+                raw_result.update({'instance': name, 'repeat': repeat, 'heuristic': heuristic})
+                raw_results.append(raw_result)
+
+            summary = summarize(method, name, results)
+            summaries.append(summary)
+            output.write('\n{method:>18} {instance:>20} moves={moves_count} iters={total_iters} '
+                         'median={median_seconds:.4f}s p95={p95_seconds:.4f}s '
+                         'nodes/s={median_nodes_per_second:.0f}\n'.format(**summary))
+            output.flush()
+
+    return raw_results, summaries
+
+
+def write_csv(path, fields, rows):
+    with open(path, 'w') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Benchmark blocksworld search methods.')
+    parser.add_argument('--methods', default='bfs,a_star,ida_star', help='comma separated Solver methods')
+    parser.add_argument('--heuristic', default='manhattan')
+    parser.add_argument('--size', help='board as HxW, the default puzzle when left out')
+    parser.add_argument('--letters', type=int, default=3)
+    parser.add_argument('--depth', type=int, default=20, help='random moves back from the goal')
+    parser.add_argument('--instances', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--warmups', type=int, default=1)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--trace-memory', action='store_true', help='record peak memory with tracemalloc, or getrusage without it')
+    parser.add_argument('--json', help='write raw results and summaries to this JSON file')
+    parser.add_argument('--csv', help='write summaries to this CSV file')
+    parser.add_argument('--raw-csv', help='write raw results to this CSV file')
+    options = parser.parse_args(arguments)
+
+    instances = build_instances(options.size, options.letters, options.depth, options.instances, options.seed)
+    raw_results, summaries = run(
+            options.methods.split(','),
+            instances,
+            options.heuristic,
+            options.warmups,
+            options.repeats,
+            options.trace_memory
+    )
+
+    if options.json:
+        with open(options.json, 'w') as json_file:
+            json.dump({'results': raw_results, 'summaries': summaries}, json_file, indent=2)
+    if options.csv:
+        write_csv(options.csv, SUMMARY_FIELDS, summaries)
+    if options.raw_csv:
+        write_csv(options.raw_csv, ['instance', 'repeat', 'heuristic'] + SearchResult.CSV_FIELDS, raw_results)
+
+
+if __name__ == "__main__":
+    main()
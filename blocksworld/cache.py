@@ -0,0 +1,131 @@
+import json
+import sqlite3
+from collections import OrderedDict
+
+from puzzle import DIRECTIONS
+
+# Results of past searches, as SearchResult.to_dict() dicts, keyed by
+# (start, goal, method, heuristic), in an in-memory LRU backed by an optional
+# sqlite file, so they survive restarts. The method includes the solver
+# settings its result depends on (see Solver.cache_method).
+# It also keeps the exact number of moves left from every state on an optimal
+# solution, with the move to take next, so that searches reaching one of these
+# states can finish by following the stored moves.
+# States and goals are keyed by their packed boards with the board's size, as
+# the packing depends on the goal.
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS results ('
+    'start TEXT, goal TEXT, method TEXT, heuristic TEXT, result TEXT, '
+    'PRIMARY KEY (start, goal, method, heuristic))',
+    'CREATE TABLE IF NOT EXISTS distances ('
+    'goal TEXT, state TEXT, distance INTEGER, move INTEGER, '
+    'PRIMARY KEY (goal, state))'
+]
+
+
+class SolutionCache(object):
+    # path: sqlite file of the cache, None to keep it in memory only.
+    # size: results kept in the in-memory LRU.
+    def __init__(self, path=None, size=256):
+        self.path = path
+        self.size = size
+        self.results = OrderedDict()
+        self.goal_distances = {}
+        self.connection = None
+        if path:
+            # Worker processes of Solver.solve_many can share the file.
+            self.connection = sqlite3.connect(path, timeout=30)
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+            self.connection.commit()
+
+    # Cached result of the method from the start state, or None.
+    def get(self, start_state, method, heuristic):
+        key = result_key(start_state, method, heuristic)
+        if key in self.results:
+            result = self.results.pop(key)
+            self.results[key] = result
+            return result
+
+        if self.connection is None:
+            return None
+        row = self.connection.execute(
+                'SELECT result FROM results WHERE start = ? AND goal = ? AND method = ? AND heuristic = ?',
+                key
+        ).fetchone()
+        if row is None:
+            return None
+
+        result = json.loads(row[0])
+        self.remember(key, result)
+        return result
+
+    def put(self, start_state, method, heuristic, result):
+        key = result_key(start_state, method, heuristic)
+        self.remember(key, result)
+        if self.connection is not None:
+            self.connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+                                    key + (json.dumps(result),))
+            self.connection.commit()
+
+    def remember(self, key, result):
+        self.results.pop(key, None)
+        self.results[key] = result
+        while len(self.results) > self.size:
+            self.results.popitem(last=False)
+
+    # Stores the moves left and the next move of every state on an optimal
+    # solution, given as direction names from the start state.
+    def record_path(self, start_state, directions):
+        distances = self.distances(start_state.layout)
+        rows = []
+        puzzle_state = start_state
+        for index, direction in enumerate(directions):
+            move = DIRECTIONS.index(direction)
+            distance = len(directions) - index
+            distances[puzzle_state.puzzle_hash()] = (distance, move)
+            rows.append((goal_key(start_state.layout), str(puzzle_state.puzzle_hash()), distance, move))
+            puzzle_state = step(puzzle_state, move)
+
+        if self.connection is not None and rows:
+            self.connection.executemany('INSERT OR REPLACE INTO distances VALUES (?, ?, ?, ?)', rows)
+            self.connection.commit()
+
+    # {packed state: (moves left, next move)} of the states on optimal
+    # solutions to the layout's goal.
+    def distances(self, layout):
+        key = goal_key(layout)
+        if key not in self.goal_distances:
+            distances = {}
+            if self.connection is not None:
+                rows = self.connection.execute('SELECT state, distance, move FROM distances WHERE goal = ?', (key,))
+                for state, distance, move in rows:
+                    distances[int(state)] = (distance, move)
+            self.goal_distances[key] = distances
+        return self.goal_distances[key]
+
+    # Follows the stored moves from a state on an optimal solution to the goal.
+    def finish(self, puzzle_state):
+        distances = self.distances(puzzle_state.layout)
+        while not puzzle_state.is_goal_state():
+            puzzle_state = step(puzzle_state, distances[puzzle_state.puzzle_hash()][1])
+        return puzzle_state
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def goal_key(layout):
+    return '{}x{}:{}'.format(layout.height, layout.width, layout.goal)
+
+
+def result_key(start_state, method, heuristic):
+    return str(start_state.puzzle_hash()), goal_key(start_state.layout), method, heuristic
+
+
+# Child of the state reached with the move code.
+def step(puzzle_state, move):
+    return next(child_state for child_state in puzzle_state.get_children() if child_state.move == move)
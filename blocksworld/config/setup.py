@@ -1,3 +1,5 @@
+import random
+
 import numpy as np
 
 
@@ -14,10 +16,67 @@ def generate_puzzle():
     ])
 
 
-def goal_state():
-    return np.array([
-        [1, 1, 1, 1],
-        [1, 2, 1, 1],
-        [1, 3, 1, 1],
-        [1, 4, 1, 0]
-    ])
\ No newline at end of file
+def goal_state(height=4, width=4, letters=3):
+    if not 0 <= letters < height * width:
+        raise ValueError("A {}x{} board fits at most {} lettered blocks".format(height, width, height * width - 1))
+
+    # 1 is the filler block, the agent ends in the bottom right corner.
+    blocks = np.ones((height, width), dtype=np.int)
+    agent_cell = (height - 1, width - 1)
+    blocks[agent_cell] = 0
+
+    # The lettered blocks are stacked in towers from the second column on,
+    # the last letter at the bottom.
+    columns = list(range(1, width)) + [0]
+    cells = [(x, y) for y in columns for x in reversed(range(height)) if (x, y) != agent_cell]
+    for cell, block in zip(cells, reversed(range(2, letters + 2))):
+        blocks[cell] = block
+
+    return blocks
+
+
+# Random instance of a height x width board with letters lettered blocks.
+# The start is depth random moves of the agent back from the goal, never
+# visiting a board twice, so it is solvable in at most depth moves.
+# A walk boxed in by boards it already visited starts over, and after
+# `attempts` walks a ValueError is raised.
+# The same seed always gives the same instance. Returns (start, goal).
+def generate_instance(height=4, width=4, letters=3, depth=20, seed=None, attempts=100):
+    generator = random.Random(seed)
+    goal = goal_state(height, width, letters)
+
+    for _ in range(attempts):
+        blocks = random_walk(goal, depth, generator)
+        if blocks is not None:
+            return blocks, goal
+
+    raise ValueError("No walk of {} moves from the {}x{} goal found in {} attempts".format(
+            depth, height, width, attempts))
+
+
+# Blocks after depth random moves of the agent from the goal, never visiting
+# a board twice, or None when boxed in before.
+def random_walk(goal, depth, generator):
+    height, width = goal.shape
+    blocks = goal.copy()
+    agent_x, agent_y = height - 1, width - 1
+    seen = {blocks.tobytes()}
+
+    for _ in range(depth):
+        moves = []
+        for x_move, y_move in ((0, 1), (1, 0), (0, -1), (-1, 0)):
+            target_x, target_y = agent_x + x_move, agent_y + y_move
+            if 0 <= target_x < height and 0 <= target_y < width:
+                child = blocks.copy()
+                child[agent_x][agent_y], child[target_x][target_y] = child[target_x][target_y], 0
+                if child.tobytes() not in seen:
+                    moves.append((child, target_x, target_y))
+
+        # Boxed in by boards already visited.
+        if len(moves) == 0:
+            return None
+
+        blocks, agent_x, agent_y = generator.choice(moves)
+        seen.add(blocks.tobytes())
+
+    return blocks
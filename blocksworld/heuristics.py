@@ -0,0 +1,209 @@
+import hashlib
+import os
+import tempfile
+from collections import deque
+
+import numpy as np
+
+from puzzle import BlocksworldPuzzle
+
+# Heuristics for informed searches.
+# A heuristic factory takes the BoardLayout of a search and returns a
+# function from a BlocksworldPuzzle to its estimated moves left.
+# Every registered heuristic is admissible, so A* stays optimal with any of them.
+HEURISTICS = {}
+
+# Where pattern databases are stored between runs.
+PDB_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pdb_cache')
+
+# Largest number of lettered blocks in a single pattern database.
+PATTERN_SIZE = 3
+
+UNREACHED = 255
+
+
+def register(name):
+    def register_factory(factory):
+        HEURISTICS[name] = factory
+        return factory
+
+    return register_factory
+
+
+def get_heuristic(name, layout):
+    if name not in HEURISTICS:
+        raise ValueError("Unknown heuristic {}, expected one of {}".format(name, sorted(HEURISTICS)))
+    return HEURISTICS[name](layout)
+
+
+@register('manhattan')
+def manhattan(layout):
+    return lambda puzzle: puzzle.total_manhattan_distance()
+
+
+# Manhattan distance plus two moves for every lettered block that has to step
+# out of its goal row or column to let another one pass.
+@register('linear_conflict')
+def linear_conflict(layout):
+    def heuristic(puzzle):
+        rows = [[] for _ in range(layout.height)]
+        columns = [[] for _ in range(layout.width)]
+
+        # Visit the cells in row-major order, so every line is filled in order.
+        for index in sorted(layout.position_of(puzzle.positions, block) for block in layout.lettered_blocks):
+            block = layout.block_at(puzzle.state, index)
+            x, y = divmod(index, layout.width)
+            goal_x, goal_y = layout.goal_coordinates[block]
+            if x == goal_x:
+                rows[x].append(goal_y)
+            if y == goal_y:
+                columns[y].append(goal_x)
+
+        conflicts = sum(line_conflicts(line) for line in rows + columns)
+        return puzzle.total_manhattan_distance() + 2 * conflicts
+
+    return heuristic
+
+
+# Blocks that have to leave a line so that the rest are in goal order:
+# the line's length minus its longest increasing run of goal positions.
+def line_conflicts(goal_positions):
+    if len(goal_positions) < 2:
+        return 0
+
+    longest = [1] * len(goal_positions)
+    for i in range(len(goal_positions)):
+        for j in range(i):
+            if goal_positions[j] < goal_positions[i]:
+                longest[i] = max(longest[i], longest[j] + 1)
+    return len(goal_positions) - max(longest)
+
+
+# Disjoint pattern databases over the lettered blocks, added together.
+# Each database counts only the moves of its own blocks, so the sum stays
+# admissible.
+@register('pdb')
+def pattern_databases(layout):
+    lettered = sorted(layout.lettered_blocks)
+    databases = [PatternDatabase.load(layout, lettered[i:i + PATTERN_SIZE])
+                 for i in range(0, len(lettered), PATTERN_SIZE)]
+
+    return lambda puzzle: sum(database.lookup(puzzle) for database in databases)
+
+
+# Exact number of pattern block moves needed to bring the agent and the
+# pattern blocks to their goal cells, ignoring every other block.
+# Entries are indexed by the cells of the agent and of the pattern blocks,
+# in mixed radix with base layout.cells.
+class PatternDatabase(object):
+    databases = {}
+
+    def __init__(self, layout, pattern, table):
+        self.layout = layout
+        self.pattern = tuple(pattern)
+        self.table = table
+
+    # Loads the database from disk, building and saving it on first use.
+    @staticmethod
+    def load(layout, pattern, directory=PDB_DIRECTORY):
+        path = PatternDatabase.path(layout, pattern, directory)
+        if path not in PatternDatabase.databases:
+            if os.path.exists(path):
+                table = np.load(path)
+            else:
+                table = PatternDatabase.build(layout, pattern)
+                PatternDatabase.save(path, table, directory)
+            PatternDatabase.databases[path] = PatternDatabase(layout, pattern, table)
+        return PatternDatabase.databases[path]
+
+    # Writes the table to a temporary file, then renames it into place, so
+    # that other processes loading the same database, such as the workers of
+    # Solver.solve_many, never see a partly written file.
+    @staticmethod
+    def save(path, table, directory=PDB_DIRECTORY):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+
+        descriptor, temporary_path = tempfile.mkstemp(suffix='.npy', dir=directory)
+        try:
+            with os.fdopen(descriptor, 'wb') as table_file:
+                np.save(table_file, table)
+            os.rename(temporary_path, path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+
+    @staticmethod
+    def path(layout, pattern, directory=PDB_DIRECTORY):
+        goal_digest = hashlib.sha1(layout.goal_blocks.tobytes()).hexdigest()[:12]
+        file_name = 'pdb_{}x{}_{}_{}.npy'.format(
+                layout.height, layout.width, goal_digest, '-'.join(str(block) for block in pattern))
+        return os.path.join(directory, file_name)
+
+    # Backward 0-1 breadth-first search from the goal. Moving the agent over a
+    # filler block costs nothing, moving it over a pattern block costs one.
+    @staticmethod
+    def build(layout, pattern):
+        cells = layout.cells
+        goal_cells = [layout.goal_coordinates[block] for block in (BlocksworldPuzzle.agent,) + tuple(pattern)]
+        goal_cells = [x * layout.width + y for x, y in goal_cells]
+
+        def encode(pattern_cells):
+            index = 0
+            for cell in reversed(pattern_cells):
+                index = index * cells + cell
+            return index
+
+        def decode(index):
+            pattern_cells = []
+            for _ in range(len(pattern) + 1):
+                index, cell = divmod(index, cells)
+                pattern_cells.append(cell)
+            return pattern_cells
+
+        neighbors = [[] for _ in range(cells)]
+        for index in range(cells):
+            x, y = divmod(index, layout.width)
+            for x_move, y_move in ((0, 1), (1, 0), (0, -1), (-1, 0)):
+                if 0 <= x + x_move < layout.height and 0 <= y + y_move < layout.width:
+                    neighbors[index].append((x + x_move) * layout.width + y + y_move)
+
+        distances = bytearray([UNREACHED]) * (cells ** (len(pattern) + 1))
+        start = encode(goal_cells)
+        distances[start] = 0
+        queue = deque([start])
+
+        while len(queue) > 0:
+            index = queue.popleft()
+            distance = distances[index]
+            pattern_cells = decode(index)
+            agent = pattern_cells[0]
+
+            for neighbor in neighbors[agent]:
+                child_cells = list(pattern_cells)
+                child_cells[0] = neighbor
+                cost = 0
+                if neighbor in pattern_cells:
+                    child_cells[pattern_cells.index(neighbor)] = agent
+                    cost = 1
+
+                child = encode(child_cells)
+                if distance + cost < distances[child]:
+                    distances[child] = distance + cost
+                    if cost:
+                        queue.append(child)
+                    else:
+                        queue.appendleft(child)
+
+        return np.frombuffer(bytes(distances), dtype=np.uint8)
+
+    def lookup(self, puzzle):
+        layout = self.layout
+        index = 0
+        for block in reversed(self.pattern):
+            index = index * layout.cells + layout.position_of(puzzle.positions, block)
+        index = index * layout.cells + puzzle.agent_index
+        return int(self.table[index])
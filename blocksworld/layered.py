@@ -0,0 +1,200 @@
+import itertools
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import batch
+
+# Breadth-first search over packed boards, one depth layer at a time.
+# Each layer is a sorted array of the unique uint64 boards first reached at
+# that depth. Moves can always be undone, so the children of a layer can only
+# be in the layer before it, in the layer itself or in the next one:
+# deduplicating against the previous two layers is enough, and older layers
+# are only kept to rebuild the path.
+# A layer is expanded a chunk at a time. The new children of each chunk, found
+# by binary search in the previous two layers, make a sorted run, and the runs
+# are merged a block at a time into the next layer. Layers and runs past the
+# memory budget are written to memory-mapped files on disk, so the search
+# only holds a few chunks and blocks in RAM on top of the budget.
+# Boards have to pack into 64 bits (see batch.fits).
+
+
+class LayeredBFS(object):
+    # memory_budget: bytes of layers, and of the runs of the layer being
+    # built, kept in RAM before spilling to disk.
+    # chunk_size: states expanded per batch, and boards merged per run and
+    # block, bounding the temporary arrays.
+    # directory: where spilled layers go, a temporary directory by default.
+    # keep_layers: keep every layer to rebuild the path. Without it only the
+    # last two layers are kept, enough to count the states of each depth.
+    def __init__(self, layout, memory_budget=2 ** 28, chunk_size=2 ** 18, directory=None, keep_layers=True):
+        if not batch.fits(layout):
+            raise ValueError("A {}x{} board does not pack into 64 bits".format(layout.height, layout.width))
+
+        self.layout = layout
+        self.memory_budget = memory_budget
+        self.chunk_size = chunk_size
+        self.directory = directory
+        self.keep_layers = keep_layers
+        self.spill_directory = None
+        self.spill_names = itertools.count()
+        self.layers = []
+        self.layer_sizes = []
+        self.expanded = 0
+        self.generated = 0
+
+    # Returns the depth of the goal, or None once every reachable board has
+    # been visited without finding it.
+    # on_layer: called with every new layer, may raise to stop the search.
+    def search(self, start_board, on_layer=None):
+        goal = np.uint64(self.layout.goal)
+        previous = np.empty(0, dtype=np.uint64)
+        current = self.store(np.array([start_board], dtype=np.uint64))
+
+        while len(current) > 0:
+            if contains(current, goal):
+                return len(self.layer_sizes) - 1
+
+            next_layer = self.expand(current, previous)
+            previous, current = current, self.store(next_layer)
+            if on_layer:
+                on_layer(current)
+
+        return None
+
+    # Boards from the start to the goal found at depth, each one a move away
+    # from the one before, found by stepping back through the stored layers.
+    def path(self, depth):
+        if not self.keep_layers:
+            raise ValueError("Layers were not kept, the path cannot be rebuilt")
+
+        board = np.uint64(self.layout.goal)
+        boards = [board]
+        for layer in reversed(self.layers[:depth]):
+            children = batch.expand_layer(self.layout, batch.layer_from_boards(self.layout, [board])).keys
+            board = next(child for child in children if contains(layer, child))
+            boards.append(board)
+
+        boards.reverse()
+        return boards
+
+    # Removes the spilled layers from disk.
+    def close(self):
+        self.layers = []
+        if self.spill_directory:
+            shutil.rmtree(self.spill_directory, ignore_errors=True)
+            self.spill_directory = None
+
+    # Sorted unique children of a layer that are in neither it nor the layer
+    # before, expanded chunk by chunk into sorted runs, then merged.
+    def expand(self, layer, previous):
+        runs = []
+        resident = 0
+        for begin in range(0, len(layer), self.chunk_size):
+            boards = np.asarray(layer[begin:begin + self.chunk_size])
+            expansion = batch.expand_layer(self.layout, batch.layer_from_boards(self.layout, boards))
+            children = np.unique(expansion.keys)
+            children = children[~contains_all(layer, children)]
+            children = children[~contains_all(previous, children)]
+            self.expanded += len(boards)
+            self.generated += len(expansion.keys)
+
+            runs.append(children)
+            resident += children.nbytes
+            if resident > self.memory_budget:
+                runs = [self.spill(run) for run in runs]
+                resident = 0
+
+        try:
+            return self.merge(runs)
+        finally:
+            for run in runs:
+                if isinstance(run, np.memmap):
+                    os.remove(run.filename)
+
+    # Sorted unique boards of sorted runs. Runs that all fit in RAM are merged
+    # at once, otherwise a block of each run at a time into a file on disk:
+    # every board up to the smallest last board of the blocks is taken from
+    # all the runs together, so each one is only written once.
+    def merge(self, runs):
+        runs = [run for run in runs if len(run) > 0]
+        if not any(isinstance(run, np.memmap) for run in runs):
+            if len(runs) == 0:
+                return np.empty(0, dtype=np.uint64)
+            return np.unique(np.concatenate(runs))
+
+        path = self.spill_path()
+        size = 0
+        starts = [0] * len(runs)
+        with open(path, 'wb') as layer_file:
+            while True:
+                active = [index for index, run in enumerate(runs) if starts[index] < len(run)]
+                if len(active) == 0:
+                    break
+
+                blocks = [np.asarray(runs[index][starts[index]:starts[index] + self.chunk_size]) for index in active]
+                last = min(block[-1] for block in blocks)
+                merged = []
+                for index, block in zip(active, blocks):
+                    end = np.searchsorted(block, last, side='right')
+                    merged.append(block[:end])
+                    starts[index] += end
+
+                merged = np.unique(np.concatenate(merged))
+                merged.tofile(layer_file)
+                size += len(merged)
+
+        if size == 0:
+            return np.empty(0, dtype=np.uint64)
+        return np.memmap(path, dtype=np.uint64, mode='r', shape=(size,))
+
+    # Keeps a new layer, spilling the oldest ones in RAM to disk while the
+    # layers held in RAM are over the memory budget.
+    def store(self, layer):
+        self.layer_sizes.append(len(layer))
+        self.layers.append(layer)
+        if not self.keep_layers:
+            self.layers = self.layers[-2:]
+
+        in_memory = [index for index, kept in enumerate(self.layers) if not isinstance(kept, np.memmap)]
+        resident = sum(self.layers[index].nbytes for index in in_memory)
+        for index in in_memory:
+            if resident <= self.memory_budget:
+                break
+            resident -= self.layers[index].nbytes
+            self.layers[index] = self.spill(self.layers[index])
+
+        return self.layers[-1]
+
+    def spill(self, layer):
+        if len(layer) == 0:
+            return layer
+
+        path = self.spill_path()
+        spilled = np.memmap(path, dtype=np.uint64, mode='w+', shape=layer.shape)
+        spilled[:] = layer
+        spilled.flush()
+        return np.memmap(path, dtype=np.uint64, mode='r', shape=layer.shape)
+
+    # A new file in the spill directory.
+    def spill_path(self):
+        if self.spill_directory is None:
+            self.spill_directory = tempfile.mkdtemp(prefix='layered_bfs_', dir=self.directory)
+        return os.path.join(self.spill_directory, 'layer_{}.u64'.format(next(self.spill_names)))
+
+
+# Membership test on a sorted layer.
+def contains(layer, board):
+    index = np.searchsorted(layer, board)
+    return index < len(layer) and layer[index] == board
+
+
+# Membership test of each board on a sorted layer, only reading the parts of
+# a spilled layer the binary searches go through.
+def contains_all(layer, boards):
+    if len(layer) == 0:
+        return np.zeros(len(boards), dtype=bool)
+    indexes = np.minimum(np.searchsorted(layer, boards), len(layer) - 1)
+    return layer[indexes] == boards
@@ -1,8 +1,7 @@
 import numpy as np
-import matplotlib
-import matplotlib.pyplot as plt
 
 from sys import stdout
+from config import setup
 from solver import Solver
 
 
@@ -11,7 +10,8 @@ def print_search_result(result):
     if result.is_successful:
         outcome = "Successful"
     else:
-        if moves_count > 900000:
+        # Stopped by the node limit of the methods that can go on forever.
+        if result.error == 'max_nodes':
             outcome = "Unsuccesful - Infinite loop"
         else:
             outcome = "Unsuccesful"
@@ -34,20 +34,15 @@ def print_search_result(result):
     print("")
 
 
-def get_seconds(total_time):
-    time = total_time
-    time_arr = str(time).split(":")
-    minutes = time_arr[1][1]
-    seconds_array = time_arr[2].split(".")
-    seconds = seconds_array[0][1] if seconds_array[0][0] == 0 else seconds_array[0]
-    seconds += "." + seconds_array[1][0]
-
-    total_seconds = float(minutes) * 60 + float(str(seconds))
-
-    return total_seconds
+# matplotlib is only imported when plotting, so the rest of this module
+# can be imported on headless machines.
+def pyplot():
+    import matplotlib.pyplot as plt
+    return plt
 
 
 def bar_plot(result, title):
+    plt = pyplot()
     OX = [
         'MinMax',
         'Alpha Beta',
@@ -79,14 +74,20 @@ def bar_plot(result, title):
     plt.show()
 
 
+# Mean of the values, 0 for none.
+def average(values):
+    return sum(values) / len(values) if values else 0
+
+
 def plot_times(result, limit=None, title=None):
+    plt = pyplot()
     bfs = result['bfs']
     id_dfs = result['id_dfs']
     a_star = result['a_star']
 
-    bfs_average = sum(bfs) / len(bfs)
-    id_dfs_average = sum(id_dfs) / len(id_dfs)
-    a_star_average = sum(a_star) / len(a_star)
+    bfs_average = average(bfs)
+    id_dfs_average = average(id_dfs)
+    a_star_average = average(a_star)
 
     lines = plt.plot(bfs, 'xr-', id_dfs, 'xb-', a_star, 'xg-', linewidth=3)
 
@@ -110,13 +111,14 @@ def plot_times(result, limit=None, title=None):
 
 
 def plot_iterations(result, limit=None, title=None):
+    plt = pyplot()
     bfs = result['bfs']
     id_dfs = result['id_dfs']
     a_star = result['a_star']
 
-    bfs_average = sum(bfs) / len(bfs)
-    id_dfs_average = sum(id_dfs) / len(id_dfs)
-    a_star_average = sum(a_star) / len(a_star)
+    bfs_average = average(bfs)
+    id_dfs_average = average(id_dfs)
+    a_star_average = average(a_star)
 
     lines = plt.plot(bfs, 'xr-', id_dfs, 'xb-', a_star, 'xg-', linewidth=3)
 
@@ -140,13 +142,14 @@ def plot_iterations(result, limit=None, title=None):
 
 
 def plot_queue_sizes(result, limit=None, title=None):
+    plt = pyplot()
     bfs = result['bfs']
     id_dfs = result['id_dfs']
     a_star = result['a_star']
 
-    bfs_average = sum(bfs) / len(bfs)
-    id_dfs_average = sum(id_dfs) / len(id_dfs)
-    a_star_average = sum(a_star) / len(a_star)
+    bfs_average = average(bfs)
+    id_dfs_average = average(id_dfs)
+    a_star_average = average(a_star)
 
     lines = plt.plot(bfs, 'xr-', id_dfs, 'xb-', a_star, 'xg-', linewidth=3)
 
@@ -170,6 +173,7 @@ def plot_queue_sizes(result, limit=None, title=None):
 
 
 def plot_moves(result, limit=None, title=None):
+    plt = pyplot()
     OX = [
         'BFS',
         'IDDFS',
@@ -180,9 +184,9 @@ def plot_moves(result, limit=None, title=None):
     id_dfs = result['id_dfs']
     a_star = result['a_star']
 
-    bfs_average = sum(bfs) / len(bfs)
-    id_dfs_average = sum(id_dfs) / len(id_dfs)
-    a_star_average = sum(a_star) / len(a_star)
+    bfs_average = average(bfs)
+    id_dfs_average = average(id_dfs)
+    a_star_average = average(a_star)
 
     OY = [bfs_average, id_dfs_average, a_star_average]
 
@@ -207,7 +211,10 @@ def plot_moves(result, limit=None, title=None):
     plt.show()
 
 
-def solve_blocksword_puzzle():
+# cache_path: sqlite file of a SolutionCache, so that the trials after the
+# first one, and later runs, reuse its results. Off by default, as it skews
+# the times compared in the plots.
+def solve_blocksword_puzzle(cache_path=None):
     solver = Solver()
 
     algorithms = [
@@ -244,45 +251,52 @@ def solve_blocksword_puzzle():
         }
     }
 
-    for i in range(10):
+    # Every trial and algorithm runs as its own job, spread over all the cores.
+    trials = 10
+    for total_result in total_results.values():
+        for key in total_result:
+            total_result[key] = [None] * trials
+
+    puzzles = [setup.generate_puzzle() for _ in range(trials)]
+    methods = [algorithm for algorithm, output_text in algorithms]
+    output_texts = dict(algorithms)
+
+    for i, algorithm, result, error in solver.solve_many(puzzles, methods, cache_path=cache_path):
         print("")
         print(i)
-        for algorithm, output_text in algorithms:
-            stdout.write(output_text)
-            result = solver.search(algorithm)
-
-            total_seconds = get_seconds(result.total_time)
-
-            total_results[algorithm]['times'].append(total_seconds)
-            total_results[algorithm]['iterations'].append(result.total_iters)
-            total_results[algorithm]['moves'].append(result.moves_count)
-            total_results[algorithm]['queue_size'].append(result.queue_size)
-
-            print_search_result(result)
-
-    plot_times({
-        'bfs': total_results['bfs']['times'],
-        'id_dfs': total_results['id_dfs']['times'],
-        'a_star': total_results['a_star']['times']
-    }, 85, 'Search Algorithms Execution Times')
-
-    plot_iterations({
-        'bfs': total_results['bfs']['iterations'],
-        'id_dfs': total_results['id_dfs']['iterations'],
-        'a_star': total_results['a_star']['iterations']
-    }, 1600000, title='Search Algorithms Total Iterations')
-
-    plot_queue_sizes({
-        'bfs': total_results['bfs']['queue_size'],
-        'id_dfs': total_results['id_dfs']['queue_size'],
-        'a_star': total_results['a_star']['queue_size']
-    }, 100000, title='Search Algorithms Queue Size at execution end')
-
-    plot_moves({
-        'bfs': total_results['bfs']['moves'],
-        'id_dfs': total_results['id_dfs']['moves'],
-        'a_star': total_results['a_star']['moves']
-    }, title='Search Algorithms Total Moves')
+        stdout.write(output_texts[algorithm])
+
+        # Failed trials are left out of the plots.
+        if error is not None or not result.is_successful:
+            print("     Failed - " + str(error or result.error))
+            continue
+
+        total_results[algorithm]['times'][i] = result.seconds
+        total_results[algorithm]['iterations'][i] = result.total_iters
+        total_results[algorithm]['moves'][i] = result.moves_count
+        total_results[algorithm]['queue_size'][i] = result.queue_size
+
+        print_search_result(result)
+
+    # The trials run side by side on every core, so their times are longer
+    # than those of trials run one at a time.
+    plot_times(succeeded(total_results, 'times'), 85,
+               'Search Algorithms Execution Times (trials run in parallel)')
+
+    plot_iterations(succeeded(total_results, 'iterations'), 1600000, title='Search Algorithms Total Iterations')
+
+    plot_queue_sizes(succeeded(total_results, 'queue_size'), 100000,
+                     title='Search Algorithms Queue Size at execution end')
+
+    plot_moves(succeeded(total_results, 'moves'), title='Search Algorithms Total Moves')
+
+
+# The values of the trials that succeeded, per plotted algorithm.
+def succeeded(total_results, key):
+    return {
+        algorithm: [value for value in total_results[algorithm][key] if value is not None]
+        for algorithm in ('bfs', 'id_dfs', 'a_star')
+    }
 
 
 # Execute solver only when running this module
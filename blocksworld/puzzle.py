@@ -1,6 +1,5 @@
 import numpy as np
-import scipy.spatial as spatial
-import hashlib
+import random
 
 from config import setup
 
@@ -15,11 +14,12 @@ class Coords:
     def is_valid(self):
         return self.x_axis_valid() and self.y_axis_valid()
 
+    # x is the row and y the column, as in blocks[x][y].
     def x_axis_valid(self):
-        return 0 <= self.x_axis < self.width
+        return 0 <= self.x_axis < self.height
 
     def y_axis_valid(self):
-        return 0 <= self.y_axis < self.height
+        return 0 <= self.y_axis < self.width
 
     @staticmethod
     def coordinates():
@@ -35,124 +35,347 @@ class Coords:
         return {v: k for k, v in Coords.coordinates().items()}
 
 
-class BlocksworldPuzzle:
-    def __init__(self, blocks, moves=0, directions=list()):
-        self.blocks = np.array(blocks, dtype=np.int)
+# Direction names by move code. States keep the code of the move that made them.
+DIRECTIONS = ('north', 'east', 'south', 'west')
+
+
+# Shape, bit packing and goal of a board, shared by every state on it.
+# A board is packed into a single int: cell (x, y) takes `bits` bits at
+# offset (x * width + y) * bits.
+# Blocks that appear once in the goal (the agent and the lettered blocks) are
+# indexed too: the cell index of block b takes `position_bits` bits at offset
+# b * position_bits of a second packed int.
+# goal_distances[b][index] is the Manhattan distance from cell index to the
+# goal cell of lettered block b.
+# symmetries are the rotations and reflections of the board that leave the
+# goal unchanged, the identity left out, each one as the cell index every
+# cell goes to. They turn moves into moves, so symmetric states are the same
+# number of moves away from the goal and need to be searched only once. The
+# default goal has none, its lettered blocks break them all.
+# moves[index] lists the (target cell index, move code) pairs of an agent on
+# cell index, shared by every layout of the same board shape.
+class BoardLayout(object):
+    __slots__ = ('height', 'width', 'cells', 'bits', 'mask', 'goal_blocks', 'goal', 'zobrist_keys',
+                 'unique_blocks', 'lettered_blocks', 'position_bits', 'position_mask',
+                 'goal_coordinates', 'goal_distances', 'symmetries', 'moves')
+
+    layouts = {}
+    move_tables = {}
+
+    def __init__(self, goal_blocks):
+        self.goal_blocks = np.array(goal_blocks, dtype=np.int)
+        self.height, self.width = self.goal_blocks.shape
+        self.cells = self.height * self.width
+        self.bits = max(1, int(self.goal_blocks.max()).bit_length())
+        self.mask = (1 << self.bits) - 1
+        self.goal = self.pack(self.goal_blocks)
+        self.zobrist_keys = None
+
+        blocks, counts = np.unique(self.goal_blocks, return_counts=True)
+        self.unique_blocks = frozenset(int(block) for block, count in zip(blocks, counts) if count == 1)
+        self.position_bits = max(1, (self.cells - 1).bit_length())
+        self.position_mask = (1 << self.position_bits) - 1
+
+        self.lettered_blocks = self.unique_blocks - {BlocksworldPuzzle.agent}
+        self.goal_coordinates = {}
+        for index in reversed(range(self.cells)):
+            self.goal_coordinates[self.block_at(self.goal, index)] = divmod(index, self.width)
+
+        self.goal_distances = [None] * (self.mask + 1)
+        for block in self.lettered_blocks:
+            goal_x, goal_y = self.goal_coordinates[block]
+            self.goal_distances[block] = [abs(index // self.width - goal_x) + abs(index % self.width - goal_y)
+                                          for index in range(self.cells)]
+
+        self.symmetries = self.goal_symmetries()
+        self.moves = BoardLayout.move_table(self.height, self.width)
+
+    # One layout per goal, so that all the states of a search share it.
+    @staticmethod
+    def for_goal(goal_blocks):
+        goal_blocks = np.array(goal_blocks, dtype=np.int)
+        layout_key = (goal_blocks.shape, goal_blocks.tobytes())
+        if layout_key not in BoardLayout.layouts:
+            BoardLayout.layouts[layout_key] = BoardLayout(goal_blocks)
+        return BoardLayout.layouts[layout_key]
+
+    def pack(self, blocks):
+        blocks = np.asarray(blocks)
+        if blocks.shape != (self.height, self.width):
+            raise ValueError("Puzzle shape {} does not match goal shape {}".format(
+                    blocks.shape, (self.height, self.width)))
+
+        state = 0
+        for index, block in enumerate(blocks.flat):
+            if not 0 <= block <= self.mask:
+                raise ValueError("Block {} does not fit in the goal's blocks".format(block))
+            state |= int(block) << (index * self.bits)
+        return state
+
+    def unpack(self, state):
+        blocks = [self.block_at(state, index) for index in range(self.cells)]
+        return np.array(blocks, dtype=np.int).reshape(self.height, self.width)
+
+    def block_at(self, state, index):
+        return (state >> (index * self.bits)) & self.mask
+
+    # Index of the first cell holding block.
+    def find(self, state, block):
+        for index in range(self.cells):
+            if (state >> (index * self.bits)) & self.mask == block:
+                return index
+        raise ValueError("Block {} is not on the board".format(block))
+
+    # Packed cell index of every unique block of state.
+    def index_positions(self, state):
+        positions = 0
+        for block in self.unique_blocks:
+            positions |= self.find(state, block) << (block * self.position_bits)
+        return positions
+
+    def position_of(self, positions, block):
+        return (positions >> (block * self.position_bits)) & self.position_mask
+
+    # Sum of the Manhattan distances of the lettered blocks to their goal cells.
+    def manhattan(self, positions):
+        return sum(self.goal_distances[block][self.position_of(positions, block)]
+                   for block in self.lettered_blocks)
+
+    # Moves block to index in the packed positions.
+    def move_position(self, positions, block, index):
+        offset = block * self.position_bits
+        return positions ^ ((self.position_of(positions, block) ^ index) << offset)
+
+    # Moves are named after (agent - target), so the agent steps the opposite way.
+    @staticmethod
+    def move_table(height, width):
+        if (height, width) not in BoardLayout.move_tables:
+            coordinates = Coords.coordinates()
+            moves = []
+            for index in range(height * width):
+                x, y = divmod(index, width)
+                cell_moves = []
+                for move, direction in enumerate(DIRECTIONS):
+                    target = Coords(x - coordinates[direction][0], y - coordinates[direction][1], height, width)
+                    if target.is_valid():
+                        cell_moves.append((target.x_axis * width + target.y_axis, move))
+                moves.append(tuple(cell_moves))
+            BoardLayout.move_tables[(height, width)] = tuple(moves)
+        return BoardLayout.move_tables[(height, width)]
+
+    def goal_symmetries(self):
+        last_x, last_y = self.height - 1, self.width - 1
+        transforms = [
+            lambda x, y: (x, last_y - y),
+            lambda x, y: (last_x - x, y),
+            lambda x, y: (last_x - x, last_y - y)
+        ]
+        # Transposes and quarter turns only keep square boards' shape.
+        if self.height == self.width:
+            transforms += [
+                lambda x, y: (y, x),
+                lambda x, y: (last_y - y, last_x - x),
+                lambda x, y: (y, last_x - x),
+                lambda x, y: (last_y - y, x)
+            ]
+
+        symmetries = []
+        for transform in transforms:
+            permutation = tuple(x * self.width + y for x, y in
+                                (transform(*divmod(index, self.width)) for index in range(self.cells)))
+            if all(self.block_at(self.goal, index) == self.block_at(self.goal, permutation[index])
+                   for index in range(self.cells)):
+                symmetries.append(permutation)
+        return symmetries
+
+    # Smallest packed state among state and its transforms under the goal's symmetries.
+    def canonical(self, state):
+        canonical = state
+        for permutation in self.symmetries:
+            transformed = 0
+            for index, target in enumerate(permutation):
+                transformed |= self.block_at(state, index) << (target * self.bits)
+            canonical = min(canonical, transformed)
+        return canonical
+
+    # Random 64-bit key for every (cell, block) pair, created on first use.
+    def zobrist_table(self, seed=0):
+        if self.zobrist_keys is None:
+            generator = random.Random(seed)
+            self.zobrist_keys = [[generator.getrandbits(64) for _ in range(self.mask + 1)]
+                                 for _ in range(self.cells)]
+        return self.zobrist_keys
+
+    def zobrist(self, state):
+        table = self.zobrist_table()
+        zobrist_hash = 0
+        for index in range(self.cells):
+            zobrist_hash ^= table[index][self.block_at(state, index)]
+        return zobrist_hash
+
+
+class BlocksworldPuzzle(object):
+    __slots__ = ('state', 'positions', 'moves', 'parent', 'move', 'layout', 'zobrist', 'manhattan')
+
+    agent = 0
+
+    # zobrist: also keep a 64-bit Zobrist hash, updated in O(1) on every move.
+    def __init__(self, blocks, moves=0, layout=None, zobrist=False):
+        self.layout = layout or BoardLayout.for_goal(setup.goal_state())
+        self.state = self.layout.pack(blocks)
+        self.positions = self.layout.index_positions(self.state)
+        self.manhattan = self.layout.manhattan(self.positions)
         self.moves = moves
-        self.directions = directions
-        self.height = None
-        self.width = None
-        self.agent = 0
-        self.goal_state = setup.goal_state()
-
+        self.parent = None
+        self.move = None
+        self.zobrist = self.layout.zobrist(self.state) if zobrist else None
+
+    # Builds a state straight from its packed form, skipping the packing.
+    # parent: state this one was reached from, with the move code move.
+    @classmethod
+    def from_packed(cls, layout, state, positions, manhattan, moves=0, parent=None, move=None, zobrist=None):
+        puzzle = cls.__new__(cls)
+        puzzle.layout = layout
+        puzzle.state = state
+        puzzle.positions = positions
+        puzzle.manhattan = manhattan
+        puzzle.moves = moves
+        puzzle.parent = parent
+        puzzle.move = move
+        puzzle.zobrist = zobrist
+        return puzzle
+
+    @property
+    def blocks(self):
+        return self.layout.unpack(self.state)
+
+    @property
+    def goal_state(self):
+        return self.layout.goal_blocks
+
+    # Directions taken from the first state, rebuilt from the parent chain.
+    @property
+    def directions(self):
+        directions = []
+        puzzle = self
+        while puzzle.parent is not None:
+            directions.append(DIRECTIONS[puzzle.move])
+            puzzle = puzzle.parent
+        directions.reverse()
+        return directions
+
+    @property
+    def agent_index(self):
+        return self.layout.position_of(self.positions, self.agent)
+
+    # O(1) for the agent and the lettered blocks, a scan for repeated blocks.
     def get_block(self, block):
-        blocks_matched = np.where(self.blocks == block)
+        if block in self.layout.unique_blocks:
+            index = self.layout.position_of(self.positions, block)
+        else:
+            index = self.layout.find(self.state, block)
         coords = Coords(
-                blocks_matched[0].item(0),
-                blocks_matched[1].item(0),
+                index // self.get_width(),
+                index % self.get_width(),
                 self.get_height(),
-                self.get_height()
+                self.get_width()
         )
         return coords
 
     def find_agent(self):
-        return self.get_block(self.agent)
+        width = self.get_width()
+        return Coords(self.agent_index // width, self.agent_index % width, self.get_height(), width)
 
     def is_goal_state(self):
-        return np.count_nonzero(self.blocks != self.goal_state) == 0
+        return self.state == self.layout.goal
 
     def get_width(self):
-        if not self.width:
-            self.width = self.blocks.shape[1]
-        return self.width
+        return self.layout.width
 
     def get_height(self):
-        if not self.height:
-            self.height = self.blocks.shape[0]
-        return self.height
+        return self.layout.height
 
     # Returns a new BlocksworldPuzzle with the agent on the new position.
     def move_agent(self, target_coords):
-        previous_agent_position = self.find_agent()
-        agent_x = previous_agent_position.x_axis
-        agent_y = previous_agent_position.y_axis
-
-        new_puzzle = np.copy(self.blocks)
-
-        target_block = self.blocks[target_coords.x_axis][target_coords.y_axis]
-        target_block_x = target_coords.x_axis
-        target_block_y = target_coords.y_axis
-
-        movement = (agent_x - target_block_x, agent_y - target_block_y)
-        direction = Coords.coordinates_by_value()[movement]
-        self.directions.append(direction)
-
-        # Replace agent with target block.
-        new_puzzle[agent_x][agent_y] = target_block
-
-        # Replace target block with agent.
-        new_puzzle[target_block_x][target_block_y] = self.agent
-
-        return BlocksworldPuzzle(new_puzzle, self.moves + 1, self.directions)
+        return self.move_agent_to(target_coords.x_axis * self.get_width() + target_coords.y_axis)
+
+    def move_agent_to(self, target_index):
+        for target, move in self.layout.moves[self.agent_index]:
+            if target == target_index:
+                return self.child(target_index, move)
+        raise ValueError("Cell {} is not next to the agent".format(target_index))
+
+    # State after the agent moves to target_index with the move code move.
+    # The agent cell holds 0, so swapping it with the target block is two XORs.
+    def child(self, target_index, move):
+        layout = self.layout
+        agent_index = self.agent_index
+        target_block = layout.block_at(self.state, target_index)
+
+        new_state = self.state \
+            ^ (target_block << (agent_index * layout.bits)) \
+            ^ (target_block << (target_index * layout.bits))
+
+        positions = layout.move_position(self.positions, self.agent, target_index)
+        manhattan = self.manhattan
+        if target_block in layout.unique_blocks:
+            positions = layout.move_position(positions, target_block, agent_index)
+            goal_distances = layout.goal_distances[target_block]
+            if goal_distances:
+                manhattan += goal_distances[agent_index] - goal_distances[target_index]
+
+        zobrist = self.zobrist
+        if zobrist is not None:
+            table = layout.zobrist_keys
+            zobrist ^= table[agent_index][self.agent] ^ table[agent_index][target_block] \
+                ^ table[target_index][target_block] ^ table[target_index][self.agent]
+
+        return BlocksworldPuzzle.from_packed(
+                layout, new_state, positions, manhattan, self.moves + 1, self, move, zobrist
+        )
 
     def neighbor_states(self, agent_coord):
-        def move_towards(direction):
-            x_axis_move = direction[0]
-            y_axis_move = direction[1]
-
-            return Coords(
-                    agent_coord.x_axis + x_axis_move,
-                    agent_coord.y_axis + y_axis_move,
-                    self.get_height(),
-                    self.get_width()
-            )
-
-        coordinates = Coords.coordinates()
-
-        possible_directions = [coordinates['north'], coordinates['east'], coordinates['south'], coordinates['west']]
-        direction_coords = set()
-
-        for possible_dir in possible_directions:
-            coordinate = move_towards(possible_dir)
-            if coordinate.is_valid():
-                direction_coords.add(coordinate)
-        return direction_coords
+        width = self.get_width()
+        agent_index = agent_coord.x_axis * width + agent_coord.y_axis
+        return set(Coords(target // width, target % width, self.get_height(), width)
+                   for target, move in self.layout.moves[agent_index])
 
     def valid_moves(self):
         return self.neighbor_states(self.find_agent())
 
-    # Generator of children moves.
+    # Generator of children moves, straight from the layout's move table.
     def get_children(self):
-        children = []
-        for valid_move in self.valid_moves():
-            children.append(self.move_agent(valid_move))
-        return children
+        return [self.child(target, move) for target, move in self.layout.moves[self.agent_index]]
 
     # Manhattan distance for block.
     def manhattan_to_goal(self, block):
         block_coords = self.get_block(block)
-        return spatial.distance.cityblock(self.get_goal_coordinates(block), (block_coords.x_axis, block_coords.y_axis))
+        goal_x, goal_y = self.get_goal_coordinates(block)
+        return abs(block_coords.x_axis - goal_x) + abs(block_coords.y_axis - goal_y)
 
-    # Manhattan distances total.
+    # Manhattan distances total of the lettered blocks.
+    # The agent and the interchangeable filler blocks are left out, so the
+    # value never overestimates the moves left. It is kept up to date by
+    # move_agent, so reading it is O(1).
     def total_manhattan_distance(self):
-        blocks = np.nditer(self.blocks)
-        distance_sum = 0
+        return self.manhattan
 
-        for block in blocks:
-            distance_sum += self.manhattan_to_goal(block)
-        return distance_sum
-
-    # create big hash of all the blocks of the puzzle, useful for comparing
+    # Exact key of the puzzle, useful for comparing: the packed board itself.
+    # No two different boards share it, so it is safe for visited sets.
     def puzzle_hash(self):
-        sha_one_blocks = hashlib.sha1(self.blocks)
-        return sha_one_blocks.hexdigest()
+        return self.state
 
-    # Goal coordinates for a single block.
-    def get_goal_coordinates(self, block):
-        goal_coordinates = np.where(self.goal_state == block)
-        matched = np.array([
-            goal_coordinates[0].item(0),
-            goal_coordinates[1].item(0)
-        ])
+    # Same for every state symmetric to this one, see BoardLayout.symmetries.
+    def canonical_hash(self):
+        return self.layout.canonical(self.state)
 
-        return matched
+    # Zobrist hash of the board, cheaper to bucket on very large boards but not
+    # collision free. Only available on puzzles created with zobrist=True.
+    def zobrist_hash(self):
+        if self.zobrist is None:
+            raise ValueError("Puzzle was created without zobrist hashing")
+        return self.zobrist
+
+    # Goal coordinates for a single block, from the layout's table.
+    def get_goal_coordinates(self, block):
+        return self.layout.goal_coordinates[block]
@@ -1,38 +1,144 @@
 import itertools
 from collections import deque
-from Queue import PriorityQueue
+import heapq
 import datetime as dt
+import json
+import multiprocessing
+import pickle
+import resource
+import signal
+import sys
+import time
 from sys import stdout
+
+import numpy as np
+
+import batch
+from cache import SolutionCache
 from config import setup
-from puzzle import BlocksworldPuzzle
+from heuristics import get_heuristic
+from layered import LayeredBFS
+from puzzle import BlocksworldPuzzle, BoardLayout
+from stats import BudgetExceeded, SearchBudget, SearchHook, SearchStats
+
+
+# Node limit of the methods that can go on forever, when no budget sets one.
+DEFAULT_MAX_NODES = {
+    'dfs': 1000000,
+    'beam_search': 1000000
+}
+
+# Methods whose solutions have the fewest moves, stored as exact distances
+# by the solution cache.
+OPTIMAL_METHODS = {'bfs', 'bidirectional_bfs', 'layered_bfs', 'id_dfs', 'a_star', 'ara_star', 'ida_star'}
+
+# Solver settings each method's result depends on, part of its key in the
+# solution cache.
+METHOD_SETTINGS = {
+    'bfs': ['symmetry'],
+    'a_star': ['symmetry'],
+    'weighted_a_star': ['weight', 'symmetry'],
+    'ara_star': ['weight', 'weight_step'],
+    'beam_search': ['beam_width']
+}
 
 
 class Solver:
-    def __init__(self):
+    # transposition_table_size: slots of the IDA* transposition table, 0 turns it off.
+    # layer_memory_budget: bytes of layers layered_bfs keeps in RAM before spilling to disk.
+    # trace_memory: record each search's peak memory, with tracemalloc or else getrusage (see SearchStats).
+    # beam_width: states kept per layer by beam_search.
+    # weight: heuristic weight of weighted_a_star, and the first one of ara_star.
+    # weight_step: how much ara_star lowers its weight after each solution.
+    # cache: SolutionCache returning the results of searches already made, and
+    # letting a_star finish from states on optimal solutions found before.
+    # symmetry: bfs, a_star and weighted_a_star count states symmetric to one
+    # another under the goal's symmetries (see BoardLayout.symmetries) as seen.
+    def __init__(self, transposition_table_size=2 ** 16, layer_memory_budget=2 ** 28, trace_memory=False,
+                 beam_width=1000, weight=2.0, weight_step=0.5, cache=None, symmetry=False):
         self.total_iters = 0
+        self.cache = cache
+        self.symmetry = symmetry
+        self.beam_width = beam_width
+        self.weight = weight
+        self.weight_step = weight_step
+        self.on_solution = None
+        self.budget = None
+        self.entry_bytes = None
+        self.transposition_table_size = transposition_table_size
+        self.layer_memory_budget = layer_memory_budget
+        self.trace_memory = trace_memory
+        self.stats = None
+        self.hooks = []
         self.queue = None
         self.visited = None
-        self.visited_directions = None
         self.puzzle_state = None
         self.heuristic = None
         self.method = None
         self.methods = {
             'bfs': self.bfs,
+            'bidirectional_bfs': self.bidirectional_bfs,
+            'layered_bfs': self.layered_bfs,
             'dfs': self.dfs,
             'id_dfs': self.id_dfs,
-            'a_star': self.a_star
+            'a_star': self.a_star,
+            'weighted_a_star': self.weighted_a_star,
+            'ara_star': self.ara_star,
+            'ida_star': self.ida_star,
+            'beam_search': self.beam_search
         }
 
-    def search(self, method):
-        self.reset_puzzle(method)
+    # heuristic: name of a registered heuristic, used by the informed methods.
+    # puzzle: blocks to solve, setup.generate_puzzle() by default.
+    # goal: blocks to reach, setup.goal_state() by default.
+    # budget: SearchBudget of the search. Once a limit is hit the search stops
+    # and returns an unsuccessful result with the counters so far and the
+    # limit as its error, or goes on with the budget's fallback method.
+    # on_solution: called by ara_star with a 'solution' record of the counters,
+    # plus the moves_count, moves and weight of the best solution so far, after
+    # the search of each weight that made it shorter. The moves are at most
+    # weight times optimal.
+    def search(self, method, heuristic='manhattan', puzzle=None, goal=None, budget=None, on_solution=None):
+        self.reset_puzzle(method, heuristic, puzzle, goal)
+        self.on_solution = on_solution
+        start_state = self.puzzle_state
+
+        if self.cache is not None:
+            cached = self.cache.get(start_state, self.cache_method(method), heuristic)
+            if cached is not None:
+                return SearchResult.from_dict(cached)
+
+        self.budget = budget or SearchBudget()
+        if self.budget.max_nodes is None and method in DEFAULT_MAX_NODES:
+            self.budget = SearchBudget(DEFAULT_MAX_NODES[method], self.budget.max_seconds,
+                                       self.budget.max_memory, self.budget.fallback)
 
         start = dt.datetime.now()
-        search_outcome = self.methods[method]()
+        self.stats.start()
+        for hook in self.hooks:
+            hook.reset(self.stats)
+        self.report('start')
+
+        try:
+            search_outcome = self.methods[method]()
+        except BudgetExceeded as exceeded:
+            search_outcome = False
+            self.stats.error = exceeded.reason
+            if exceeded.reason == 'max_memory' and self.budget.fallback:
+                search_outcome = self.run_fallback(start_state, heuristic)
+
+        # The state that went over the node limit was counted, but not expanded.
+        if self.stats.error == 'max_nodes':
+            self.total_iters = min(self.total_iters, self.budget.max_nodes)
+        self.stats.expanded = self.total_iters
+        self.stats.stop()
         end = dt.datetime.now()
+        record = self.report('finish')
 
-        if self.puzzle_state:
+        # Without a solution, the last state explored is no answer.
+        if search_outcome and self.puzzle_state:
             moves = self.puzzle_state.moves
-            directions = self.puzzle_state.directions if len(self.puzzle_state.directions) < 50 else []
+            directions = self.puzzle_state.directions
         else:
             moves = None
             directions = None
@@ -43,66 +149,387 @@ class Solver:
                 len(self.queue),
                 moves,
                 directions,
-                end - start
+                end - start,
+                record
         )
 
+        # Searches cut short by their budget could end differently next time.
+        if self.cache is not None and result.error is None and result.fallback is None:
+            self.cache.put(start_state, self.cache_method(method), heuristic, result.to_dict())
+            if result.is_successful and method in OPTIMAL_METHODS:
+                self.cache.record_path(start_state, directions)
+
         return result
 
+    # Solves every (puzzle, method) pair on a pool of worker processes, each
+    # with a solver of the same settings as this one (see config).
+    # A puzzle is either its blocks or a (blocks, goal) pair, as made by
+    # setup.generate_instance.
+    # Yields (puzzle index, method, SearchResult, error) tuples as the jobs finish.
+    # error is None, 'timeout' when the job ran over timeout seconds, 'memory'
+    # when it ran over memory_limit bytes of address space, or the repr of any
+    # other exception the job raised. In all these cases the result is
+    # unsuccessful, and the other jobs go on.
+    # With a memory_limit, every job runs in a process of its own: a worker
+    # out of memory may not even manage to send its result back, and is
+    # reported as 'memory' once it exits without one.
+    # cache_path: sqlite file of a SolutionCache shared by the workers.
+    def solve_many(self, puzzles, methods, workers=None, heuristic='manhattan', timeout=None, memory_limit=None,
+                   cache_path=None):
+        jobs = [(index, puzzle, method, heuristic, self.config(), timeout, cache_path)
+                for index, puzzle in enumerate(puzzles)
+                for method in methods]
+
+        if memory_limit:
+            for job_result in solve_capped(jobs, workers or multiprocessing.cpu_count(), memory_limit, timeout):
+                yield job_result
+            return
+
+        pool = multiprocessing.Pool(workers)
+        try:
+            for job_result in pool.imap_unordered(solve_job, jobs):
+                yield job_result
+        finally:
+            pool.terminate()
+            pool.join()
+
+    # Arguments rebuilding this solver, but for its cache, in a worker process.
+    def config(self):
+        return {
+            'transposition_table_size': self.transposition_table_size,
+            'layer_memory_budget': self.layer_memory_budget,
+            'trace_memory': self.trace_memory,
+            'beam_width': self.beam_width,
+            'weight': self.weight,
+            'weight_step': self.weight_step,
+            'symmetry': self.symmetry
+        }
+
+    # Calls callback with a record of the search's counters (see stats.py)
+    # every `every` expanded states and/or every `seconds` seconds, and when
+    # each search starts and finishes.
+    def add_hook(self, callback, every=20000, seconds=None):
+        hook = SearchHook(callback, every, seconds)
+        self.hooks.append(hook)
+        return hook
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def report(self, event, hooks=None):
+        record = self.stats.record(event, len(self.queue), len(self.visited))
+        for hook in self.hooks if hooks is None else hooks:
+            hook.fire(record)
+        return record
+
+    # Method as keyed in the solution cache, with the settings its result
+    # depends on, so that solvers with other settings do not share results.
+    def cache_method(self, method):
+        settings = ['{}={}'.format(name, getattr(self, name)) for name in METHOD_SETTINGS.get(method, [])]
+        if not settings:
+            return method
+        return '{}({})'.format(method, ','.join(settings))
+
+    # Key of a state in visited sets and frontier tables: its hash, or with
+    # symmetry on, the same key for every state symmetric to it.
+    def state_key(self, puzzle_state):
+        if self.symmetry:
+            return puzzle_state.canonical_hash()
+        return puzzle_state.puzzle_hash()
+
+    # Continues a search that went over its memory budget with the budget's
+    # fallback method, from the start again, under what is left of the budget.
+    def run_fallback(self, start_state, heuristic):
+        fallback = self.budget.fallback
+        self.stats.fallback = fallback
+        self.puzzle_state = start_state
+        self.queue = [start_state]
+        self.visited = set()
+        self.heuristic = self.stats.counted(get_heuristic(heuristic, start_state.layout))
+
+        # The fallback only gets a node limit when it could go on forever.
+        if self.budget.max_nodes is None and fallback in DEFAULT_MAX_NODES:
+            self.budget = SearchBudget(self.total_iters + DEFAULT_MAX_NODES[fallback], self.budget.max_seconds,
+                                       self.budget.max_memory)
+        # Three layers of the beam and its children, with room to spare.
+        beam_width = self.beam_width
+        if fallback == 'beam_search':
+            self.beam_width = max(1, self.budget.max_memory // (self.entry_bytes * 16))
+
+        try:
+            search_outcome = self.methods[fallback]()
+            self.stats.error = None
+        except BudgetExceeded as exceeded:
+            search_outcome = False
+            self.stats.error = exceeded.reason
+        finally:
+            self.beam_width = beam_width
+        return search_outcome
+
+    # Estimated bytes of the frontier and visited states.
+    # Layers of layered_bfs spilled to disk take no RAM, and are left out.
+    def memory(self):
+        def container_bytes(container):
+            if isinstance(container, np.memmap):
+                return 0
+            if hasattr(container, 'nbytes'):
+                return container.nbytes
+            return len(container) * self.entry_bytes
+
+        return container_bytes(self.queue) + container_bytes(self.visited)
+
     def log_state(self):
         if self.total_iters % 20000 == 0:
             stdout.write(".")
             stdout.flush()
 
-    def reset_puzzle(self, method):
+        self.stats.expanded = self.total_iters
+        self.budget.check(self.stats, self.memory)
+
+        if self.hooks:
+            due_hooks = [hook for hook in self.hooks if hook.due(self.stats)]
+            if due_hooks:
+                self.report('progress', due_hooks)
+
+    def reset_puzzle(self, method, heuristic='manhattan', puzzle=None, goal=None):
         self.total_iters = 0
-        self.puzzle_state = BlocksworldPuzzle(setup.generate_puzzle())
+        self.stats = SearchStats(method, self.trace_memory)
+        if puzzle is None:
+            puzzle = setup.generate_puzzle()
+        layout = BoardLayout.for_goal(goal) if goal is not None else None
+        # The IDA* transposition table picks its slots by Zobrist hash.
+        self.puzzle_state = BlocksworldPuzzle(puzzle, layout=layout, zobrist=method == 'ida_star')
         self.visited = set()
-        self.visited_directions = {}
+        # A state, its packed ints, and a container entry pointing to it.
+        self.entry_bytes = sys.getsizeof(self.puzzle_state) + sys.getsizeof(self.puzzle_state.state) \
+            + sys.getsizeof(self.puzzle_state.positions) + 64
 
         if method == 'bfs':
             self.queue = deque([self.puzzle_state])
+        elif method == 'layered_bfs':
+            self.queue = []
+        elif method == 'bidirectional_bfs':
+            self.queue = [self.puzzle_state]
+            self.visited = {}
         elif method == 'dfs':
             self.queue = [self.puzzle_state]
             self.visited = {}
         elif method == 'id_dfs':
             self.queue = [self.puzzle_state]
             self.visited = {}
-        elif method == 'a_star':
-            self.queue = PriorityQueue()
-            self.queue.put((0, self.puzzle_state))
-            self.heuristic = lambda heur: heur.total_manhattan_distance()
+        elif method in ('a_star', 'weighted_a_star', 'ara_star'):
+            self.queue = [(0, 0, self.puzzle_state)]
+            self.heuristic = self.stats.counted(get_heuristic(heuristic, self.puzzle_state.layout))
+        elif method == 'ida_star':
+            self.queue = [self.puzzle_state]
+            self.heuristic = self.stats.counted(get_heuristic(heuristic, self.puzzle_state.layout))
+        elif method == 'beam_search':
+            self.queue = [self.puzzle_state]
+            self.heuristic = self.stats.counted(get_heuristic(heuristic, self.puzzle_state.layout))
 
     # Breadth-first search.
+    # Boards that pack into 64 bits are expanded a whole layer at a time,
+    # bigger ones one state at a time.
+    def bfs(self):
+        if batch.fits(self.puzzle_state.layout):
+            return self.bfs_layers()
+        return self.bfs_states()
+
+    # Breadth-first search, one state at a time.
     # FIFO queue -- Double Ended Queue(DEQUEUE)
     # GET - left | ADD - right.
-    def bfs(self):
+    def bfs_states(self):
         while len(self.queue) > 0:
             self.total_iters += 1
             self.log_state()
-            self.visited_directions = {}
 
             # Get nearest(more shallow state.
             self.puzzle_state = self.queue.popleft()
             # Add current state to visited ones
-            self.visited.add(self.puzzle_state.puzzle_hash())
-            self.visited_directions[self.puzzle_state.puzzle_hash()] = self.puzzle_state.directions
+            self.visited.add(self.state_key(self.puzzle_state))
 
             if self.puzzle_state.is_goal_state():
                 return True
 
-            def is_visited(state, visited):
-                return state.puzzle_hash() in visited
-
             # Queue extend with not visited
             valid_children = []
             for child_state in self.puzzle_state.get_children():
-                if not is_visited(child_state, self.visited):
+                self.stats.generated += 1
+                if self.state_key(child_state) not in self.visited:
                     valid_children.append(child_state)
+                else:
+                    self.stats.duplicates += 1
             self.queue.extend(valid_children)
 
         # No result.
         return False
 
+    # Breadth-first search, one layer at a time.
+    # QUEUE: the current layer, an array of packed states (see batch.py).
+    # Visited: sorted array of the packed boards of every layer so far.
+    # Children are deduplicated with np.unique and dropped when already visited.
+    # With symmetry on, visited holds canonical boards instead.
+    def bfs_layers(self):
+        start_state = self.puzzle_state
+        layout = start_state.layout
+        goal = np.uint64(layout.goal)
+
+        self.queue = batch.layer_from_states([start_state])
+        self.visited = self.layer_keys(layout, self.queue[:, 0])
+        # Per layer: its states, and the parent row and move code of each one.
+        layers = [(self.queue, None, None)]
+
+        while len(self.queue) > 0:
+            self.total_iters += len(self.queue)
+            self.log_state()
+
+            goal_rows = np.nonzero(self.queue[:, 0] == goal)[0]
+            if len(goal_rows) > 0:
+                self.puzzle_state = self.replay_layers(start_state, layers, goal_rows[0])
+                return True
+
+            expansion = batch.expand_layer(layout, self.queue)
+            keys, first_rows = np.unique(self.layer_keys(layout, expansion.keys), return_index=True)
+            new_keys = ~np.in1d(keys, self.visited, assume_unique=True)
+            new_rows = first_rows[new_keys]
+            self.stats.generated += len(expansion.keys)
+            self.stats.duplicates += len(expansion.keys) - len(new_rows)
+
+            self.queue = expansion.children[new_rows]
+            self.visited = np.union1d(self.visited, keys[new_keys])
+            layers.append((self.queue, expansion.parents[new_rows], expansion.moves[new_rows]))
+
+        # No result.
+        return False
+
+    # Packed boards, or canonical boards with symmetry on, as keys of bfs_layers.
+    def layer_keys(self, layout, boards):
+        if self.symmetry:
+            return batch.canonical_boards(layout, boards)
+        return boards
+
+    # Walks back from a row of the last layer to the start, then replays the
+    # agent's cells from the start state, so the result holds the whole path.
+    @staticmethod
+    def replay_layers(start_state, layers, row):
+        agent_cells = []
+        for layer, parents, moves in reversed(layers[1:]):
+            agent_cells.append(int(layer[row, 1]))
+            row = parents[row]
+
+        agent_cells.reverse()
+        return Solver.replay(start_state, agent_cells)
+
+    # Moves the agent through agent_cells, one move each, from start_state.
+    @staticmethod
+    def replay(start_state, agent_cells):
+        puzzle_state = start_state
+        for agent_cell in agent_cells:
+            puzzle_state = puzzle_state.move_agent_to(agent_cell)
+        return puzzle_state
+
+    # Breadth-first search with the layered engine of layered.py.
+    # Only the last two layers are needed to deduplicate, so memory does not
+    # grow with every state seen, and layers over the memory budget go to disk.
+    # QUEUE: the last layer, a sorted array of packed boards.
+    def layered_bfs(self):
+        start_state = self.puzzle_state
+        layout = start_state.layout
+        engine = LayeredBFS(layout, self.layer_memory_budget)
+
+        # Layers over the memory budget are spilled to disk, and then no longer
+        # count against the search budget's max_memory (see memory).
+        def on_layer(layer):
+            self.total_iters = engine.expanded
+            self.queue = layer
+            self.log_state()
+
+        try:
+            depth = engine.search(start_state.state, on_layer)
+            self.total_iters = engine.expanded
+            self.stats.generated = engine.generated
+            self.stats.duplicates = engine.generated - sum(engine.layer_sizes[1:])
+            self.queue = engine.layers[-1]
+            if depth is None:
+                return False
+
+            boards = engine.path(depth)
+            agent_cells = [int(agent_cell) for agent_cell in batch.layer_from_boards(layout, boards[1:])[:, 1]]
+            self.puzzle_state = self.replay(start_state, agent_cells)
+            return True
+        finally:
+            engine.close()
+
+    # Bidirectional breadth-first search.
+    # Grows one frontier from the start and one from the goal, a whole layer of
+    # the smaller one at a time, until they meet in the middle.
+    # Optimal like BFS, with each side only going about half as deep.
+    # Visited : {state_hash:state}, one for each side.
+    def bidirectional_bfs(self):
+        start_state = self.puzzle_state
+        goal_state = BlocksworldPuzzle(start_state.goal_state, layout=start_state.layout)
+
+        if start_state.is_goal_state():
+            return True
+
+        forward_layer = [start_state]
+        backward_layer = [goal_state]
+        self.visited = {start_state.puzzle_hash(): start_state}
+        backward_visited = {goal_state.puzzle_hash(): goal_state}
+
+        while len(forward_layer) > 0 and len(backward_layer) > 0:
+            if len(forward_layer) <= len(backward_layer):
+                forward_layer, meeting = self.expand_layer(forward_layer, self.visited, backward_visited)
+            else:
+                backward_layer, meeting = self.expand_layer(backward_layer, backward_visited, self.visited)
+                if meeting:
+                    meeting = meeting[1], meeting[0]
+            self.queue = forward_layer + backward_layer
+
+            if meeting:
+                self.puzzle_state = self.join_paths(*meeting)
+                return True
+
+        # No result.
+        return False
+
+    # Expands every state of a layer into the next one.
+    # Also returns the (child, other side's state) pair where the two searches
+    # meet with the fewest moves, or None.
+    def expand_layer(self, layer, visited, other_visited):
+        next_layer = []
+        meeting = None
+
+        for puzzle_state in layer:
+            self.total_iters += 1
+            self.log_state()
+
+            for child_state in puzzle_state.get_children():
+                self.stats.generated += 1
+                child_hash = child_state.puzzle_hash()
+                if child_hash in visited:
+                    self.stats.duplicates += 1
+                    continue
+
+                visited[child_hash] = child_state
+                next_layer.append(child_state)
+
+                other_state = other_visited.get(child_hash)
+                if other_state is not None and (meeting is None or other_state.moves < meeting[1].moves):
+                    meeting = child_state, other_state
+
+        return next_layer, meeting
+
+    # Continues the forward state along the backward state's path to the goal,
+    # so the returned state holds the whole solution.
+    @staticmethod
+    def join_paths(forward_state, backward_state):
+        puzzle_state = forward_state
+        while backward_state.parent is not None:
+            backward_state = backward_state.parent
+            puzzle_state = puzzle_state.move_agent_to(backward_state.agent_index)
+        return puzzle_state
+
     # Depth First Search.
     # Not optimal solution.
     # It can go on infinitely.
@@ -112,30 +539,28 @@ class Solver:
         # Visited : {state_hash:state_depth}
         self.visited = {}
 
+        # The search budget stops it after DEFAULT_MAX_NODES['dfs'] iterations
+        # by default, in case of infinite loop.
         while len(self.queue) > 0:
-            # Stopping in 1000000 iterations in case of infinite loop
-            if self.total_iters > 1000000:
-                return False
             self.total_iters += 1
             self.log_state()
 
             # Get the state that is deepest
             self.puzzle_state = self.queue.pop()  # Get deepest state.
+            puzzle_hash = self.puzzle_state.puzzle_hash()
             # Add current state in visited.
-            self.visited[self.puzzle_state.puzzle_hash()] = self.puzzle_state.moves
-            self.visited_directions[self.puzzle_state.puzzle_hash()] = self.puzzle_state.directions
+            self.visited[puzzle_hash] = self.puzzle_state.moves
 
             if self.puzzle_state.is_goal_state():
                 return True
 
-            def is_visited(child, visited):
-                return child.puzzle_hash() in visited
-
             valid_children = []
             for child_state in self.puzzle_state.get_children():
-                if not is_visited(child_state, self.visited) \
-                        or self.visited[child_state.puzzle_hash()] > child_state.moves:
+                self.stats.generated += 1
+                if self.visited.get(child_state.puzzle_hash(), child_state.moves + 1) > child_state.moves:
                     valid_children.append(child_state)
+                else:
+                    self.stats.duplicates += 1
             self.queue.extend(valid_children)
 
         # No result
@@ -144,7 +569,7 @@ class Solver:
     # Iterative deepening depth-first search.
     # The solution is more optimal than DFS.
     # It is faster than BFS
-    # It can go on infinitely, like DFS.
+    # It gives up once a whole depth limit is searched without cutting anything off.
     # LIFO Queue --> python list()
     def id_dfs(self):
         start_state = self.puzzle_state
@@ -152,6 +577,7 @@ class Solver:
         for depth in itertools.count():
             self.queue = [start_state]
             self.visited = {}
+            cut_off = False
 
             while len(self.queue) > 0:
                 self.total_iters += 1
@@ -159,75 +585,460 @@ class Solver:
 
                 # Get the state that is the deepest.
                 self.puzzle_state = self.queue.pop()
+                puzzle_hash = self.puzzle_state.puzzle_hash()
                 # Add current state to visited ones.
-                self.visited[self.puzzle_state.puzzle_hash()] = self.puzzle_state.moves
-                self.visited_directions[self.puzzle_state.puzzle_hash()] = self.puzzle_state.directions
+                self.visited[puzzle_hash] = self.puzzle_state.moves
 
                 if self.puzzle_state.is_goal_state():
                     return True
 
-                def is_visited(child, visited):
-                    return child.puzzle_hash() in visited
-
-                if self.puzzle_state.moves < depth:
+                if self.puzzle_state.moves == depth:
+                    cut_off = True
+                else:
                     valid_children = []
                     for child_state in self.puzzle_state.get_children():
-                        if not is_visited(child_state, self.visited) \
-                                or self.visited[child_state.puzzle_hash()] > child_state.moves:
+                        self.stats.generated += 1
+                        if self.visited.get(child_state.puzzle_hash(), child_state.moves + 1) > child_state.moves:
                             valid_children.append(child_state)
+                        else:
+                            self.stats.duplicates += 1
                     self.queue.extend(valid_children)
 
-        return False
+            # Every reachable state was within the depth limit, so there is no solution.
+            if not cut_off:
+                return False
 
     # A* search.
     # Most optimal solution time-wise.
-    # QUEUE: PRIORITY QUEUE(when _get() is used, it gets the item with the minimum value first)
+    # QUEUE: binary heap of (total moves, insertion order, state) entries. The
+    # insertion order breaks ties first-in first-out, so states never get compared.
     # ORDER: Heuristic(Total Manhattan Distance + number of state moves)
     def a_star(self):
+        return self.best_first(1)
+
+    # Weighted A* search.
+    # A* with the heuristic multiplied by self.weight: it heads to the goal
+    # more greedily and expands far fewer states, with at most weight times
+    # the optimal number of moves.
+    def weighted_a_star(self):
+        return self.best_first(self.weight)
+
+    # A* ordered by moves + weight * heuristic.
+    # Without weight, states on optimal solutions in the solution cache give
+    # a solution through them, kept until no state left could beat it.
+    def best_first(self, weight):
         # Total_moves = total so far + total to be made
         def total_moves(puzzle_state, heuristic):
-            return puzzle_state.moves + heuristic(self.puzzle_state)
+            return puzzle_state.moves + weight * heuristic(puzzle_state)
 
-        def state_cost_tuple(puzzle_state, heuristic):
-            return total_moves(puzzle_state, heuristic), puzzle_state
+        insertion_order = itertools.count(1)
+        # Fewest moves a state has been pushed with. Worse duplicates are never pushed.
+        best_moves = {self.state_key(self.puzzle_state): 0}
+        exact_distances = {}
+        if self.cache is not None and weight == 1:
+            exact_distances = self.cache.distances(self.puzzle_state.layout)
+        # Cached state on the best solution so far, and its total moves.
+        through_state, through_moves = None, float('inf')
+        if self.puzzle_state.puzzle_hash() in exact_distances:
+            through_state = self.puzzle_state
+            through_moves = exact_distances[self.puzzle_state.puzzle_hash()][0]
 
-        def valid_children(puzzle_state, visited):
-            children = []
-            for child_state in puzzle_state.get_children():
-                if child_state.puzzle_hash() not in visited:
-                    children.append(child_state)
-            return children
+        while len(self.queue) > 0:
+            if through_moves <= self.queue[0][0]:
+                self.puzzle_state = self.cache.finish(through_state)
+                return True
+
+            # Get state with lowest value(moves left)
+            self.puzzle_state = heapq.heappop(self.queue)[2]
+            state_key = self.state_key(self.puzzle_state)
+
+            # Stale entry, the state was expanded or pushed again with fewer moves.
+            if state_key in self.visited or best_moves[state_key] < self.puzzle_state.moves:
+                self.stats.duplicates += 1
+                continue
 
-        while not self.queue.empty():
             self.total_iters += 1
             self.log_state()
 
-            # Get state with lowest value(moves left)
-            self.puzzle_state = self.queue.get()[1]
             # Add state to visited
-            self.visited.add(self.puzzle_state.puzzle_hash())
-            self.visited_directions[self.puzzle_state.puzzle_hash()] = self.puzzle_state.directions
+            self.visited.add(state_key)
 
             if self.puzzle_state.is_goal_state():
-                self.queue = self.queue.queue
                 return True
 
-            for valid_child in valid_children(self.puzzle_state, self.visited):
-                self.queue.put(state_cost_tuple(valid_child, self.heuristic))
+            for child_state in self.puzzle_state.get_children():
+                self.stats.generated += 1
+                child_key = self.state_key(child_state)
+                if child_key in self.visited or best_moves.get(child_key, float('inf')) <= child_state.moves:
+                    self.stats.duplicates += 1
+                    continue
+
+                best_moves[child_key] = child_state.moves
+                heapq.heappush(self.queue, (
+                    total_moves(child_state, self.heuristic),
+                    next(insertion_order),
+                    child_state
+                ))
+
+                child_hash = child_state.puzzle_hash()
+                if child_hash in exact_distances and child_state.moves + exact_distances[child_hash][0] < through_moves:
+                    through_state = child_state
+                    through_moves = child_state.moves + exact_distances[child_hash][0]
+
+        if through_state is not None:
+            self.puzzle_state = self.cache.finish(through_state)
+            return True
 
         # No result
-        self.queue = self.queue.queue
+        return False
+
+    # Anytime repairing A* (ARA*).
+    # Weighted A* starting at self.weight, that finds a first solution fast,
+    # then lowers the weight by self.weight_step and improves it, down to a
+    # weight of 1 and an optimal solution. Each search reuses the states of
+    # the one before: only states reached with fewer moves are expanded again.
+    # Under a time or node budget, the best solution so far is returned once
+    # the budget runs out, with the budget's limit as the error.
+    # QUEUE: binary heap of (moves + weight * heuristic, insertion order, state) entries.
+    def ara_star(self):
+        start_state = self.puzzle_state
+        goal_hash = start_state.layout.goal
+        insertion_order = itertools.count(1)
+        heuristics = {}
+        # State reached with the fewest moves, per hash.
+        best_states = {start_state.puzzle_hash(): start_state}
+        # Hashes of the states to search from with the next weight.
+        frontier = {start_state.puzzle_hash()}
+        weight = self.weight
+
+        def total_moves(puzzle_state):
+            puzzle_hash = puzzle_state.puzzle_hash()
+            if puzzle_hash not in heuristics:
+                heuristics[puzzle_hash] = self.heuristic(puzzle_state)
+            return puzzle_state.moves + weight * heuristics[puzzle_hash]
+
+        solution = start_state if start_state.is_goal_state() else None
+        reported_moves = None
+        try:
+            while True:
+                self.queue = [(total_moves(best_states[puzzle_hash]), next(insertion_order), best_states[puzzle_hash])
+                              for puzzle_hash in frontier]
+                heapq.heapify(self.queue)
+                self.visited = set()
+                # States reached with fewer moves after they were expanded.
+                inconsistent = set()
+
+                # Search until no state left could lead to a better solution.
+                while len(self.queue) > 0 and (solution is None or solution.moves > self.queue[0][0]):
+                    self.puzzle_state = heapq.heappop(self.queue)[2]
+                    puzzle_hash = self.puzzle_state.puzzle_hash()
+                    if puzzle_hash in self.visited or best_states[puzzle_hash] is not self.puzzle_state:
+                        self.stats.duplicates += 1
+                        continue
+
+                    self.total_iters += 1
+                    self.log_state()
+                    self.visited.add(puzzle_hash)
+
+                    for child_state in self.puzzle_state.get_children():
+                        self.stats.generated += 1
+                        child_hash = child_state.puzzle_hash()
+                        if child_hash in best_states and best_states[child_hash].moves <= child_state.moves:
+                            self.stats.duplicates += 1
+                            continue
+
+                        best_states[child_hash] = child_state
+                        if child_hash == goal_hash:
+                            solution = child_state
+                        if child_hash in self.visited:
+                            inconsistent.add(child_hash)
+                        else:
+                            heapq.heappush(self.queue, (total_moves(child_state), next(insertion_order), child_state))
+
+                if solution is not None and (reported_moves is None or solution.moves < reported_moves):
+                    self.report_solution(solution, weight)
+                    reported_moves = solution.moves
+                if weight <= 1:
+                    break
+
+                weight = max(1, weight - self.weight_step)
+                frontier = {entry[2].puzzle_hash() for entry in self.queue} - self.visited | inconsistent
+        except BudgetExceeded as exceeded:
+            if solution is None:
+                raise
+            self.stats.error = exceeded.reason
+
+        self.puzzle_state = solution
+        return solution is not None
+
+    def report_solution(self, solution, weight):
+        if self.on_solution is None:
+            return
+
+        self.stats.expanded = self.total_iters
+        record = self.stats.record('solution', len(self.queue), len(self.visited))
+        record.update({'moves_count': solution.moves, 'moves': solution.directions, 'weight': weight})
+        self.on_solution(record)
+
+    # Iterative deepening A*.
+    # Depth-first search that skips states whose total moves (moves so far +
+    # heuristic) go over a bound. When it fails, the bound grows to the smallest
+    # total that went over it. Optimal like A*, with only the current path in
+    # memory plus the fixed-size transposition table.
+    # LIFO Queue --> python list() of (state, children left) for the current path.
+    def ida_star(self):
+        start_state = self.puzzle_state
+        bound = self.heuristic(start_state)
+        table = None
+        if self.transposition_table_size:
+            table = TranspositionTable(self.transposition_table_size)
+
+        while True:
+            self.total_iters += 1
+            self.log_state()
+
+            if start_state.is_goal_state():
+                return True
+
+            next_bound = float('inf')
+            path = {start_state.puzzle_hash()}
+            self.queue = [(start_state, iter(start_state.get_children()))]
+            self.visited = path
+
+            while len(self.queue) > 0:
+                puzzle_state, children = self.queue[-1]
+                child_state = next(children, None)
+
+                # All children tried, backtrack.
+                if child_state is None:
+                    self.queue.pop()
+                    path.discard(puzzle_state.puzzle_hash())
+                    continue
+
+                self.stats.generated += 1
+                child_hash = child_state.puzzle_hash()
+                if child_hash in path:
+                    self.stats.duplicates += 1
+                    continue
+
+                total_moves = child_state.moves + self.heuristic(child_state)
+                if total_moves > bound:
+                    next_bound = min(next_bound, total_moves)
+                    continue
+
+                if table is not None and table.reached(child_state.zobrist_hash(), child_hash,
+                                                       child_state.moves, bound):
+                    self.stats.duplicates += 1
+                    continue
+
+                self.total_iters += 1
+                self.log_state()
+
+                if child_state.is_goal_state():
+                    self.puzzle_state = child_state
+                    return True
+
+                path.add(child_hash)
+                self.queue.append((child_state, iter(child_state.get_children())))
+
+            # No state went over the bound, so there is no solution.
+            if next_bound == float('inf'):
+                return False
+            bound = next_bound
+
+    # Beam search.
+    # Breadth-first, but each layer only keeps the beam_width states with the
+    # lowest heuristic. Memory is bounded by the width, the moves are not
+    # optimal and a solution can be missed.
+    # States are only checked against the previous and the current layer, as
+    # a move can always be undone.
+    # QUEUE: python list() of the current layer.
+    def beam_search(self):
+        previous = set()
+
+        while len(self.queue) > 0:
+            self.visited = {puzzle_state.puzzle_hash() for puzzle_state in self.queue}
+            children = {}
+
+            for self.puzzle_state in self.queue:
+                self.total_iters += 1
+                self.log_state()
+
+                if self.puzzle_state.is_goal_state():
+                    return True
+
+                for child_state in self.puzzle_state.get_children():
+                    self.stats.generated += 1
+                    child_hash = child_state.puzzle_hash()
+                    if child_hash in self.visited or child_hash in previous or child_hash in children:
+                        self.stats.duplicates += 1
+                        continue
+                    children[child_hash] = child_state
+
+            previous = self.visited
+            self.queue = heapq.nsmallest(self.beam_width, children.values(), key=self.heuristic)
+
         return False
 
 
+# Fixed-size table of the fewest moves each state was reached with in an IDA*
+# iteration. A state reached again with no fewer moves in the same iteration
+# cannot lead anywhere new, so it is pruned.
+# Slots are picked by Zobrist hash. On a collision the entry with fewer moves
+# is kept, as it roots the bigger subtree; entries of older iterations are
+# always replaced.
+class TranspositionTable(object):
+    def __init__(self, size):
+        self.size = size
+        self.keys = [None] * size
+        self.moves = [0] * size
+        self.bounds = [None] * size
+
+    # True if the state was already reached in this iteration with no more moves,
+    # otherwise records it.
+    def reached(self, zobrist_hash, puzzle_hash, moves, bound):
+        slot = zobrist_hash % self.size
+
+        if self.bounds[slot] == bound:
+            if self.keys[slot] == puzzle_hash:
+                if self.moves[slot] <= moves:
+                    return True
+            elif self.moves[slot] <= moves:
+                return False
+
+        self.keys[slot] = puzzle_hash
+        self.moves[slot] = moves
+        self.bounds[slot] = bound
+        return False
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def raise_search_timeout(signum, frame):
+    raise SearchTimeout()
+
+
+# Caps the address space of a solve_many worker process.
+def limit_memory(memory_limit):
+    if memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+
+# Runs the jobs of solve_many, at most `workers` at a time, each one in a new
+# process capped at memory_limit bytes that sends its result through a pipe.
+# A worker that exits without a result ran out of memory. One still running
+# well after its own timeout should have stopped it is killed.
+def solve_capped(jobs, workers, memory_limit, timeout):
+    pending = list(reversed(jobs))
+    running = []
+
+    while pending or running:
+        while pending and len(running) < workers:
+            job = pending.pop()
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=run_capped_job, args=(job, memory_limit, sender))
+            process.start()
+            sender.close()
+            running.append((job, process, receiver, dt.datetime.now()))
+
+        still_running = []
+        for job, process, receiver, start in running:
+            job_result = None
+            # Once the worker exits, receiving gives its result or EOFError.
+            if receiver.poll() or not process.is_alive():
+                try:
+                    job_result = receiver.recv()
+                except (EOFError, MemoryError, pickle.UnpicklingError):
+                    job_result = failed_job(job, 'memory', start)
+            elif timeout and (dt.datetime.now() - start).total_seconds() > timeout + 1:
+                process.terminate()
+                job_result = failed_job(job, 'timeout', start)
+
+            if job_result is None:
+                still_running.append((job, process, receiver, start))
+                continue
+            process.join()
+            receiver.close()
+            yield job_result
+
+        running = still_running
+        if running:
+            time.sleep(0.01)
+
+
+def run_capped_job(job, memory_limit, sender):
+    limit_memory(memory_limit)
+    try:
+        sender.send(solve_job(job))
+    except MemoryError:
+        pass
+    finally:
+        sender.close()
+
+
+# solve_many entry of a job that did not finish.
+def failed_job(job, error, start, total_iters=0):
+    index, method = job[0], job[2]
+    result = SearchResult(False, total_iters, 0, None, None, dt.datetime.now() - start,
+                          {'method': method, 'error': error})
+    return index, method, result, error
+
+
+# Runs one solve_many job in a worker process.
+def solve_job(job):
+    index, puzzle, method, heuristic, config, timeout, cache_path = job
+    goal = None
+    if isinstance(puzzle, tuple):
+        puzzle, goal = puzzle
+    cache = None
+    solver = None
+    start = dt.datetime.now()
+    error = None
+
+    if timeout:
+        signal.signal(signal.SIGALRM, raise_search_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        cache = SolutionCache(cache_path) if cache_path else None
+        solver = Solver(cache=cache, **config)
+        result = solver.search(method, heuristic, puzzle, goal)
+    except SearchTimeout:
+        error = 'timeout'
+    except MemoryError:
+        error = 'memory'
+    except Exception as exception:
+        error = repr(exception)
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        if cache:
+            cache.close()
+
+    if error:
+        return failed_job(job, error, start, solver.total_iters if solver is not None else 0)
+    return index, method, result, error
+
+
+# Outcome of a search.
+# record: the search's 'finish' record from stats.py, for the counters,
+# timings and peak memory.
 class SearchResult:
-    def __init__(self, is_succesful, total_iters, queue_size, moves_count, total_moves, time_elapsed):
+    CSV_FIELDS = [
+        'method', 'fallback', 'successful', 'error', 'moves_count', 'total_iters', 'generated', 'duplicates',
+        'queue_size', 'visited_size', 'heuristic_evaluations', 'seconds', 'nodes_per_second', 'peak_memory',
+        'peak_memory_source'
+    ]
+
+    def __init__(self, is_succesful, total_iters, queue_size, moves_count, total_moves, time_elapsed, record=None):
         self.__is_succesful = is_succesful
         self.__total_iters = total_iters
         self.__queue_size = queue_size
         self.__moves_count = moves_count
         self.__moves = total_moves
         self.__time_elapsed = time_elapsed
+        self.__record = record or {}
 
     @property
     def is_successful(self):
@@ -252,3 +1063,88 @@ class SearchResult:
     @property
     def total_time(self):
         return self.__time_elapsed
+
+    @property
+    def method(self):
+        return self.__record.get('method')
+
+    @property
+    def error(self):
+        return self.__record.get('error')
+
+    # Method that went on with the search once it ran out of memory, if any.
+    @property
+    def fallback(self):
+        return self.__record.get('fallback')
+
+    # Wall time in seconds, from time.perf_counter when the search recorded it.
+    @property
+    def seconds(self):
+        if 'elapsed' in self.__record:
+            return self.__record['elapsed']
+        return self.__time_elapsed.total_seconds()
+
+    @property
+    def nodes_per_second(self):
+        return self.__total_iters / self.seconds if self.seconds > 0 else 0.0
+
+    @property
+    def generated(self):
+        return self.__record.get('generated')
+
+    @property
+    def duplicates(self):
+        return self.__record.get('duplicates')
+
+    @property
+    def visited_size(self):
+        return self.__record.get('visited_size')
+
+    @property
+    def heuristic_evaluations(self):
+        return self.__record.get('heuristic_evaluations')
+
+    # Peak memory in bytes, None unless the solver traced memory.
+    @property
+    def peak_memory(self):
+        return self.__record.get('peak_memory')
+
+    # 'tracemalloc' or 'ru_maxrss', see SearchStats.
+    @property
+    def peak_memory_source(self):
+        return self.__record.get('peak_memory_source')
+
+    def to_dict(self):
+        result = {
+            'method': self.method,
+            'fallback': self.fallback,
+            'successful': self.is_successful,
+            'error': self.error,
+            'moves_count': self.moves_count,
+            'total_iters': self.total_iters,
+            'generated': self.generated,
+            'duplicates': self.duplicates,
+            'queue_size': self.queue_size,
+            'visited_size': self.visited_size,
+            'heuristic_evaluations': self.heuristic_evaluations,
+            'seconds': self.seconds,
+            'nodes_per_second': self.nodes_per_second,
+            'peak_memory': self.peak_memory,
+            'peak_memory_source': self.peak_memory_source,
+            'moves': self.moves
+        }
+        return result
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+    @staticmethod
+    def from_dict(result):
+        record = dict(result, elapsed=result['seconds'])
+        return SearchResult(result['successful'], result['total_iters'], result['queue_size'],
+                            result['moves_count'], result['moves'], dt.timedelta(seconds=result['seconds']), record)
+
+    # Values in the order of CSV_FIELDS, for csv.writer.
+    def to_csv_row(self):
+        result = self.to_dict()
+        return [result[field] for field in self.CSV_FIELDS]
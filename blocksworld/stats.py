@@ -0,0 +1,163 @@
+try:
+    from time import perf_counter
+except ImportError:
+    from time import time as perf_counter
+
+import sys
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# Counters of a single search, reported to hooks as plain dict records.
+# expanded: states taken off the frontier and expanded.
+# generated: children made while expanding.
+# duplicates: children, or frontier entries, dropped as already seen.
+# heuristic_evaluations: calls to the search's heuristic.
+# With trace_memory, peak_memory is the peak traced by tracemalloc or, where
+# there is none (Python 2), the peak resident size of the whole process so
+# far from getrusage. memory_source says which one.
+class SearchStats(object):
+    def __init__(self, method, trace_memory=False):
+        self.method = method
+        self.expanded = 0
+        self.generated = 0
+        self.duplicates = 0
+        self.heuristic_evaluations = 0
+        self.error = None
+        self.fallback = None
+        self.memory_source = None
+        if trace_memory:
+            if tracemalloc is not None:
+                self.memory_source = 'tracemalloc'
+            elif resource is not None:
+                self.memory_source = 'ru_maxrss'
+            else:
+                raise ValueError("Memory can not be traced on this platform")
+        self.trace_memory = self.memory_source == 'tracemalloc'
+        self.started_tracing = False
+        self.start_time = None
+        self.end_time = None
+        self.peak_memory = None
+
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        self.start_time = perf_counter()
+
+    def stop(self):
+        self.end_time = perf_counter()
+        if self.trace_memory:
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            if self.started_tracing:
+                tracemalloc.stop()
+        elif self.memory_source == 'ru_maxrss':
+            self.peak_memory = max_resident_memory()
+
+    def elapsed(self):
+        return (self.end_time or perf_counter()) - self.start_time
+
+    # Wraps a heuristic so that its calls are counted.
+    def counted(self, heuristic):
+        def counted_heuristic(puzzle_state):
+            self.heuristic_evaluations += 1
+            return heuristic(puzzle_state)
+
+        return counted_heuristic
+
+    def record(self, event, frontier_size, visited_size):
+        elapsed = self.elapsed()
+        peak_memory = self.peak_memory
+        if peak_memory is None and self.trace_memory:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        elif peak_memory is None and self.memory_source == 'ru_maxrss':
+            peak_memory = max_resident_memory()
+
+        return {
+            'event': event,
+            'method': self.method,
+            'elapsed': elapsed,
+            'expanded': self.expanded,
+            'generated': self.generated,
+            'duplicates': self.duplicates,
+            'frontier_size': frontier_size,
+            'visited_size': visited_size,
+            'heuristic_evaluations': self.heuristic_evaluations,
+            'nodes_per_second': self.expanded / elapsed if elapsed > 0 else 0.0,
+            'peak_memory': peak_memory,
+            'peak_memory_source': self.memory_source,
+            'error': self.error,
+            'fallback': self.fallback
+        }
+
+
+# Peak resident bytes of the process, which getrusage gives in kilobytes on
+# Linux and in bytes on macOS.
+def max_resident_memory():
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+# A callback taking records, called every `every` expanded states and/or
+# every `seconds` seconds, plus once when the search starts and finishes.
+class SearchHook(object):
+    def __init__(self, callback, every=None, seconds=None):
+        self.callback = callback
+        self.every = every
+        self.seconds = seconds
+        self.next_expanded = None
+        self.next_time = None
+
+    def reset(self, stats):
+        self.next_expanded = self.every
+        self.next_time = stats.start_time + self.seconds if self.seconds else None
+
+    def due(self, stats):
+        if self.next_expanded is not None and stats.expanded >= self.next_expanded:
+            return True
+        return self.next_time is not None and perf_counter() >= self.next_time
+
+    def fire(self, record):
+        if self.every:
+            self.next_expanded = (record['expanded'] // self.every + 1) * self.every
+        if self.seconds:
+            self.next_time = perf_counter() + self.seconds
+        self.callback(record)
+
+
+# Resource limits of a single search, None for no limit. A search over one
+# of them stops with the name of the limit as its error.
+# max_nodes: states expanded, the search stops at the next one.
+# max_seconds: wall time.
+# max_memory: bytes of the frontier and visited states, estimated from the
+# size of a state and of its container entry.
+# fallback: method to run instead, inside max_memory, once max_memory is hit.
+class SearchBudget(object):
+    def __init__(self, max_nodes=None, max_seconds=None, max_memory=None, fallback=None):
+        self.max_nodes = max_nodes
+        self.max_seconds = max_seconds
+        self.max_memory = max_memory
+        self.fallback = fallback
+
+    # Raises BudgetExceeded once a limit is hit.
+    def check(self, stats, memory):
+        if self.max_nodes is not None and stats.expanded > self.max_nodes:
+            raise BudgetExceeded('max_nodes')
+        if self.max_seconds is not None and stats.elapsed() >= self.max_seconds:
+            raise BudgetExceeded('max_seconds')
+        if self.max_memory is not None and memory() >= self.max_memory:
+            raise BudgetExceeded('max_memory')
+
+
+class BudgetExceeded(Exception):
+    def __init__(self, reason):
+        super(BudgetExceeded, self).__init__(reason)
+        self.reason = reason